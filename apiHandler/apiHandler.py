@@ -1,15 +1,55 @@
-import requests, sys, os, random, getopt
+import re, threading, time
 
 ## @package apiHandler
 #  Provide simple interaction the spotify api
+#
+#  Heavy modules are imported where they are needed,
+#  so e.g. --now never loads the dialog or thread pool machinery.
 
 # own
 from apiHandler.auth import authorize as auth
-from apiHandler.util import log, ui
+from apiHandler.playlist import Playlist
+from apiHandler.util import log, ui, scheduler, cache, history, index, pipeline, prefetch, rank, transport
 
 ## Enable debug logging
 debug = False
 
+## Playlists requested per search page (spotify maximum: 50)
+page_size = 50
+
+## Maximum number of concurrent search page requests
+page_workers = 10
+
+## Highest search result offset spotify allows
+max_depth = 1000
+
+## Maximum number of keywords searched concurrently
+keyword_workers = 4
+
+## Number of playlists suggested per dialog
+batch_size = 10
+
+## Number of background workers prefetching while suggestions are shown
+prefetch_workers = 2
+
+## Seconds a user's device list is cached
+device_ttl = 600
+
+## Seconds between playback checks while nothing is playing
+follow_idle = 30
+
+## Maximum seconds between playback checks while playing
+follow_playing = 15
+
+## Minimum seconds between playback checks
+follow_min = 1
+
+## Seconds to wait after the current song should have ended
+follow_slack = 0.5
+
+## Market of searched content, 'from_token' being the user's country
+market = 'from_token'
+
 ## @class APIErrorCodes
 #  Helper for spotify API return codes
 class APIErrorCodes:
@@ -21,6 +61,36 @@ class APIErrorCodes:
 	premium_required = 403
 	not_found = 404
 	too_many = 429
+	unavailable = 503
+
+## Describe a track or podcast episode
+#  @param item track or episode object as returned by spotify
+#  @return string 'artist - title' or 'show - episode'
+def describe(item):
+	creator=''
+	if item.get('show'):
+		creator = item.get('show').get('name')
+	elif item.get('artists'):
+		creator = item.get('artists')[0].get('name')
+	return "%s - %s" %(creator, item.get('name'))
+
+## Split a search term into keywords
+#  @param term comma separated keywords, e.g. "lofi, jazzhop"
+#  @return list of distinct keywords in given order
+def keywords(term):
+	words = []
+	for word in term.split(','):
+		word = ' '.join(word.split())
+		if word != '' and word.lower() not in [w.lower() for w in words]:
+			words.append(word)
+	return words
+
+## Get the endpoint a request goes to
+#  @param url request url
+#  @return url path below the api version with ids replaced, e.g. 'playlists/{id}/tracks'
+def endpoint(url):
+	path = url.split('?')[0].split('/v1/', 1)[-1]
+	return re.sub(r"(?<=/)[0-9A-Za-z]{22}(?=/|$)", "{id}", path)
 
 ## @class ApiHandler
 #  Handle interaction with the spotify API
@@ -29,18 +99,42 @@ class APIErrorCodes:
 class ApiHandler:
 
 	## Constructor
-	#  @param keyword search term for playlists (optional)
+	#  @param keyword search term for playlists, comma separated keywords are searched separately (optional)
+	#  @param depth maximum number of playlists to search [default: one page]
+	#  @param lazy only authorize the selected user, on its first API call
+	#  @param http transport for all requests, a \a scheduler.Scheduler or a \a transport.Transport,
+	#  which sends requests unscheduled [default: shared scheduler]
+	#  @param cached answer searches from the search cache and playlist index if possible
+	#  @param refresh bypass cached search results, but store fresh ones
+	#  @param batch suggest several playlists per dialog instead of one at a time
 	#
 	#  The constructor loads stored credentials, selects a valid user
 	#  and requests a keyword is not provided via call parameter. 
-	def __init__(self, keyword=None):
+	def __init__(self, keyword=None, depth=None, lazy=True, http=None, cached=True, refresh=False, batch=True):
 		self._log = log.log(self.__class__.__name__, debug)
 		self._log.dbg("hello from playlist fetcher")
 
-		self._auth = auth.Auth()
+		self._http = scheduler.shared() if http is None else http
+		self._auth = auth.Auth(lazy=lazy, http=self._http)
 		self._ui = ui.Ui()
 		self._user = ""
+		self._pipeline = pipeline.Pipeline(self._http, [
+			pipeline.Timeout(transport.default_timeout),
+			pipeline.CircuitBreaker(),
+			pipeline.Authorization(self._auth, lambda: str(self._user)),
+			pipeline.Retry(),
+		])
 		self.keyword = keyword
+		self.depth = page_size if depth is None else min(depth, max_depth)
+		self._cache = cache.Cache('playlists') if cached else None
+		self._index = index.Index() if cached else None
+		self._devices = cache.Cache('devices', ttl=device_ttl, grace=0) if cached else None
+		self._history = history.History() if cached else None
+		self._prefetch = None
+		self.refresh = refresh
+		self.batch = batch
+		self._stats = {}
+		self._stats_lock = threading.Lock()
 
 
 	## Select a valid user for API calls
@@ -60,7 +154,7 @@ class ApiHandler:
 			user = self._auth.valid_users()[0]
 		elif ulen > 1:
 			self._log.dbg("asking user for user selection")
-			q = "Found %d authenticated users:\n%s\n\nEnter username to select:" %(ulen, self._auth.valid_users())
+			q = "Found %d usable users:\n%s\n\nEnter username to select:" %(ulen, self._auth.valid_users())
 			i = 0; i_max = 3
 			while user not in self._auth.valid_users():
 				i += 1
@@ -72,6 +166,15 @@ class ApiHandler:
 		self._user = user
 		return True
 
+
+	## Keep the selected user's access token renewed in the background
+	#
+	#  Meant for long-running processes, so that no request
+	#  has to wait for a token refresh.
+	def keep_token_fresh(self):
+		self._auth.access_token(str(self._user))
+		self._auth.start_refresh_ahead(str(self._user))
+
 	
 	## Return a playlist url
 	#  @return string containing browser-callable playlist url
@@ -107,69 +210,125 @@ class ApiHandler:
 			self._log.log("no music currently playing")
 			return ''
 
+	## Follow the currently playing song
+	#  @return generator yielding a dict containing 'playing' and 'track'
+	#  ('artist - title' or empty string) whenever either of them changes
+	#
+	#  Runs until the caller stops iterating. While nothing is playing,
+	#  playback is checked every \a follow_idle seconds. While playing, it is
+	#  checked shortly after the current song should end, but at least
+	#  every \a follow_playing seconds to notice skipped songs.
+	#  Failed checks are retried after \a follow_idle seconds.
+	def follow_current(self):
+		self.keep_token_fresh()
+		url = "https://api.spotify.com/v1/me/player/currently-playing"
+		params = {'additional_types': 'episode', 'market': market}
+		last = None
+
+		while True:
+			wait = follow_idle
+			res = self._request('GET', url, params=params)
+
+			if res.get('error') in (None, APIErrorCodes.no_content):
+				item = res.get('item')
+				state = {'playing': bool(res.get('is_playing')) and item is not None, 'track': describe(item) if item else ''}
+				if state != last:
+					last = state
+					yield state
+
+				if state['playing']:
+					remaining = (item.get('duration_ms', 0) - (res.get('progress_ms') or 0)) / 1000
+					wait = max(follow_min, min(follow_playing, remaining + follow_slack))
+			else:
+				self._log.dbgerr("could not check playback: error %s" %(res.get('error')))
+
+			self._log.dbg("checking playback again in %.1fs" %(wait))
+			time.sleep(wait)
+
+
+	## Start playback of a playlist on one of the user's devices
+	#  @param link playlist url as returned by \a get_playlist()
+	#  @return name of the device playing, or None if playback could not be started
+	#
+	#  The active device is used, or else the first one available.
+	#  If the cached device list is outdated, it is fetched again once.
+	#
+	#  @note This requires a premium spotify account.
+	def play(self, link):
+		pid = link.rstrip('/').split('/')[-1].split('?')[0]
+		context_uri = "spotify:playlist:%s" %(pid)
+
+		for refresh in (False, True):
+			device = self._get_active_device(refresh)
+			if device is None:
+				continue
+
+			res = self._start_playback(context_uri, device['id'])
+			if res == APIErrorCodes.premium_required:
+				self._log.err("Playback requires a premium spotify account, sorry.")
+				return None
+			if res is None:
+				self._log.dbg("playing %s on %s" %(context_uri, device['name']))
+				return device['name']
 
-	## Toggle playback
-	#  In theory, this should toggle the user's playback. Untested, since I dont have a premium spotify account
-	def _toggle_playback(self):
-		url = "https://api.spotify.com/v1/me/player/play"
-		headers = {'Authorization': f"Bearer {self._auth.access_token(str(self._user))}"}
-
-		## @todo: need to put the actual data here.
-		#  https://developer.spotify.com/console/put-play/
+		self._log.log("no spotify device available")
+		return None
 
-		response = requests.put(url, headers=headers)
-		res = self._check_response(response)
-		self._log.dbg_json(res)
+	## Start playback
+	#  @param context_uri spotify uri of e.g. a playlist
+	#  @param device_id device to play on
+	#  @return None if playback started, else the error code
+	def _start_playback(self, context_uri, device_id):
+		url = "https://api.spotify.com/v1/me/player/play"
+		res = self._request('PUT', url, params={'device_id': device_id}, json={'context_uri': context_uri})
 
-		if res.get('error'):
+		# a successful call answers 204 no content
+		if res.get('error') not in (None, APIErrorCodes.no_content):
 			self._log.log("Recieved an error")
-			if res.get('error') == APIErrorCodes.premium_required:
-				self._log.log("This action required a premium spotify account, sorry.")
-			return None
-
+			return res.get('error')
 		return None
 
-	def _get_active_device(self):
-		res = None
-		url = "https://api.spotify.com/v1/me/player/devices"
-		headers = {'Authorization': f"Bearer {self._auth.access_token(str(self._user))}"}
+	## Get the device to play on
+	#  @param refresh ignore the cached device list
+	#  @return device dict containing 'id' and 'name', or None if no device is available
+	#
+	#  The active device is preferred, restricted devices cannot be controlled.
+	def _get_active_device(self, refresh=False):
+		devices = None
+		key = cache.Cache.key(self._user)
+		if self._devices is not None and not refresh:
+			devices, _ = self._devices.get(key)
+
+		if devices is None:
+			url = "https://api.spotify.com/v1/me/player/devices"
+			res = self._request('GET', url)
+			if res.get('error'):
+				self._log.log("Recieved an error")
+				return None
 
-		response = requests.get(url, headers=headers)
-		res = self._check_response(response)
-		self._log.dbg_json(res)
+			devices = [{'id': d.get('id'), 'name': d.get('name'), 'is_active': d.get('is_active')}
+				for d in res.get('devices') or [] if d.get('id') and not d.get('is_restricted')]
+			if self._devices is not None:
+				self._devices.put(key, devices)
 
-		if res.get('error'):
-			self._log.log("Recieved an error")
-			return res
+		for device in devices:
+			if device['is_active']:
+				return device
+		return devices[0] if len(devices) > 0 else None
 
-		for device in res.get('devices'):
-			if device.is_active:
-				res = device.id
-				break
 
-		return res
-	
-	
 	## Retrieve currently playing track
 	#  @return tuple containing playback status and 'artist - song name' as string
 	def _get_current(self):
 		ret = (None, None)
-		url = "https://api.spotify.com/v1/me/player/currently-playing?additional_types=episode"
-		headers = {'Authorization': f"Bearer {self._auth.access_token(str(self._user))}"}
-
-		response = requests.get(url, headers=headers)
-		res = self._check_response(response)
-		self._log.dbg_json(res)
+		url = "https://api.spotify.com/v1/me/player/currently-playing"
+		params = {'additional_types': 'episode', 'market': market}
+		res = self._request('GET', url, params=params)
 
 		if res.get('error'):
 			self._log.log("Recieved an error")
 			if res.get('error') == APIErrorCodes.no_content:
 				self._log.log("no currently playing")
-			if res.get('error') == APIErrorCodes.permission_missing:
-				if self._auth.authorize(self._user):
-					return self.get_current_playing()
-				else:
-					self._log.err("Could not refresh access token for user %s" %(self._user))
 			return ret
 
 		active = res.get('is_playing')
@@ -180,17 +339,43 @@ class ApiHandler:
 		self._log.dbg_json(item)
 
 		if item is not None:
-			creator=''
-			if item.get('show'):
-				creator = item.get('show').get('name')
-			elif item.get('artists'):
-				creator = item.get('artists')[0].get('name')
-
-			itemstr = "%s - %s" %(creator, item.get('name'))
+			itemstr = describe(item)
 			self._log.log(itemstr)
 			ret = (active, itemstr)
 		return ret
 
+	## Send a request to spotify through the request pipeline
+	#  @param method HTTP method
+	#  @param url request url
+	#  @return the response object if API call was successful, else an object containing error code
+	#
+	#  The pipeline adds the user's access token, refreshes it once
+	#  if it was rejected and retries requests which failed to arrive.
+	def _request(self, method, url, **kwargs):
+		response = self._pipeline.request(method, url, **kwargs)
+		start = time.perf_counter()
+		res = self._check_response(response)
+		self._count(endpoint(url), len(response.content or b''), time.perf_counter() - start)
+		self._log.dbg_json(res)
+		return res
+
+	## Count a response in the per-endpoint statistics
+	#  @param name endpoint as returned by \a endpoint()
+	#  @param size response body size in bytes
+	#  @param seconds time taken to decode the response
+	def _count(self, name, size, seconds):
+		with self._stats_lock:
+			stats = self._stats.setdefault(name, {'requests': 0, 'bytes': 0, 'decode_ms': 0.0})
+			stats['requests'] += 1
+			stats['bytes'] += size
+			stats['decode_ms'] += seconds * 1000
+
+	## Get per-endpoint response statistics
+	#  @return dict of endpoint to dict of requests, received bytes and decode time in ms
+	def stats(self):
+		with self._stats_lock:
+			return {name: dict(stats) for name, stats in self._stats.items()}
+
 	## Check a response from spotify API
 	#  @param response as recieved from API call
 	#  @return the response object if API call was successful, else an object containing error code
@@ -211,6 +396,8 @@ class ApiHandler:
 				self._log.dbgerr("bad request")
 			elif response.status_code == APIErrorCodes.permission_missing:
 				self._log.dbgerr("permissions missing")
+			elif response.status_code == APIErrorCodes.too_many:
+				self._log.err("spotify rate limit exceeded, try again later")
 
 		return res
 
@@ -226,73 +413,274 @@ class ApiHandler:
 		return True
 
 
-	## Get playlists matching keyword from spotify
-	#  @return list of playlists, or None if no playlists found
+	## Get one page of playlists matching a keyword from spotify
+	#  @param keyword search term
+	#  @param offset index of the first playlist to return
+	#  @param limit number of playlists to return
+	#  @param priority scheduler priority of the request
+	#  @return search response, or an object containing error code
+	def _fetch_page(self, keyword, offset, limit, priority=scheduler.INTERACTIVE):
+		url = "https://api.spotify.com/v1/search"
+		params = {'q': keyword, 'type': 'playlist', 'market': market, 'offset': offset, 'limit': limit}
+		return self._request('GET', url, params=params, priority=priority)
+
+
+	## Get playlists matching keywords
+	#  @return list of \a Playlist records, or None if no playlists found
+	#
+	#  Each keyword is searched concurrently. Playlists found by several
+	#  keywords are merged, see \a _merge().
 	def _fetch_lists(self):
 		if self.keyword == '':
-			self.get_keyword()
-		
-		url = "https://api.spotify.com/v1/search?q=%s&type=playlist" %(self.keyword)
-		headers = {'Authorization': f"Bearer {self._auth.access_token(str(self._user))}"}
+			self._get_keyword()
 
-		response = requests.get(url, headers=headers)
-		res = self._check_response(response)
-		self._log.dbg_json(res)
+		words = keywords(self.keyword)
+		if len(words) == 0:
+			return None
+		elif len(words) == 1:
+			results = [self._fetch_keyword(words[0])]
+		else:
+			from concurrent.futures import ThreadPoolExecutor
+			self._log.dbg("searching %d keywords" %(len(words)))
+			with ThreadPoolExecutor(max_workers=min(keyword_workers, len(words))) as pool:
+				results = list(pool.map(self._fetch_keyword, words))
+
+		return self._merge(words, results)
+
+
+	## Merge search results of several keywords
+	#  @param words list of keywords
+	#  @param results list of playlist lists (or None) per keyword
+	#  @return list of distinct playlists, or None if no playlists found
+	#
+	#  Each playlist's keywords are set to the keywords which found it.
+	#  Playlists matching more keywords come first.
+	def _merge(self, words, results):
+		merged = {}
+		for word, lists in zip(words, results):
+			for pl in lists or []:
+				if pl.id not in merged:
+					pl.keywords = []
+					merged[pl.id] = pl
+				if word not in merged[pl.id].keywords:
+					merged[pl.id].keywords.append(word)
+
+		if len(merged) == 0:
+			return None
+		return sorted(merged.values(), key=lambda pl: len(pl.keywords), reverse=True)
+
+
+	## Get playlists matching a single keyword
+	#  @param keyword search term
+	#  @return list of \a Playlist records, or None if no playlists found
+	#
+	#  Results are served from the search cache when possible.
+	#  Stale cache entries are returned immediately and refreshed
+	#  in the background.  
+	#  Otherwise spotify is searched. If that fails, e.g. without
+	#  a network connection, matching playlists from the local index are used.
+	def _fetch_keyword(self, keyword):
+		if self._cache is None:
+			return self._fetch_remote(keyword)
+
+		key = cache.Cache.key(keyword, self.depth)
+		if not self.refresh:
+			lists, fresh = self._cache.get(key)
+			if lists is not None:
+				if not fresh:
+					self._log.dbg("revalidating cached results for %s" %(keyword))
+					threading.Thread(target=self._revalidate, args=(key, keyword)).start()
+				return [Playlist.from_row(row) for row in lists]
+
+		lists = self._fetch_remote(keyword)
+		if lists is None:
+			local = self._index.search(keyword)[:self.depth]
+			self._log.dbg("using %d indexed playlists for %s" %(len(local), keyword))
+			return local if len(local) > 0 else None
+
+		self._cache.put(key, [pl.to_row() for pl in lists])
+		self._index.add(lists)
+		return lists
+
+
+	## Refresh a search cache entry
+	#  @param key cache key
+	#  @param keyword search term
+	def _revalidate(self, key, keyword):
+		lists = self._fetch_remote(keyword, scheduler.PREFETCH)
+		if lists is not None:
+			self._cache.put(key, [pl.to_row() for pl in lists])
+			self._index.add(lists)
+
+
+	## Get playlists matching a keyword from spotify
+	#  @param keyword search term
+	#  @param priority scheduler priority of the requests
+	#  @return list of \a Playlist records, or None if no playlists found
+	#
+	#  The first page tells how many playlists there are,
+	#  the remaining pages up to \a depth are then fetched concurrently.
+	def _fetch_remote(self, keyword, priority=scheduler.INTERACTIVE):
+		limit = min(self.depth, page_size)
+		res = self._fetch_page(keyword, 0, limit, priority)
 
 		if res.get('error'):
 			self._log.log("Recieved an error")
-			if res.get('error') == APIErrorCodes.permission_missing:
-				if self._auth.authorize(self._user):
-					return self._fetch_lists()
-				else:
-					self._log.err("Could not refresh access token for user %s" %(self._user))
 			return None
 
 		# look for the playlists
 		if not res.get('playlists'):
 			print("something went wrong")
 			return None
-		elif not res.get('playlists').get('items') or (len(res.get('playlists').get('items')) == 0) :
+
+		items = res.get('playlists').get('items') or []
+		depth = min(self.depth, res.get('playlists').get('total', 0))
+		offsets = range(limit, depth, page_size)
+
+		if len(offsets) > 0:
+			from concurrent.futures import ThreadPoolExecutor
+			self._log.dbg("fetching %d more pages" %(len(offsets)))
+			with ThreadPoolExecutor(max_workers=min(page_workers, len(offsets))) as pool:
+				pages = pool.map(lambda offset: self._fetch_page(keyword, offset, min(page_size, depth - offset), priority), offsets)
+				for page in pages:
+					if page.get('error') or not page.get('playlists'):
+						self._log.dbgerr("skipping failed page")
+						continue
+					items.extend(page.get('playlists').get('items') or [])
+
+		# spotify may return empty slots for unavailable playlists
+		lists = [Playlist.from_json(item) for item in items if item]
+		if len(lists) == 0:
 			print("no results found")
 			return None
 
-		return res.get('playlists').get('items')
+		return lists
+
 
+	## Order playlists randomly for suggestion
+	#  @param playlists list of \a Playlist records
+	#  @return shuffled list of the same playlists
+	#
+	#  More relevant playlists tend to come first, see \a rank.order().
+	#  Recently rejected or played playlists come last.
+	def _shuffle(self, playlists):
+		return rank.order(playlists, self._history)
 
-	## Suggest random playlists to iser and let them choose
-	#  @param playlists list of playlists as returned by fetch_listst
+	## Let user choose a playlist
+	#  @param playlists list of \a Playlist records as returned by fetch_lists
 	#  @return playlist url or None if aborted by user
+	#
+	#  While the user looks at suggestions, the search results following
+	#  the first \a depth ones are prefetched. This is cancelled once
+	#  the user made a choice.
 	def _select_playlist(self, playlists):
-		# suggestion and selection
-		accepted = False
+		self._prefetch = prefetch.Prefetcher(prefetch_workers)
+		following = None
+		if self.depth < max_depth:
+			following = self._prefetch.submit('search', self._fetch_following, keywords(self.keyword))
+
+		pl = None
+		candidates = self._shuffle(playlists)
+		try:
+			pl = self._select_batch(candidates, following) if self.batch else self._select_single(candidates, following)
+		finally:
+			self._prefetch.cancel()
+
+		if pl is None:
+			self._log.err("user aborted")
+			return None
+		if self._history is not None:
+			self._history.accept(pl)
+		self._log.dbg("got playlist %s: %s" %(pl.id, pl.name))
+		self._log.dbg(pl.url)
+		return pl.url
+
+	## Suggest several playlists at once and let user choose one
+	#  @param candidates list of \a Playlist records in order of suggestion
+	#  @param following future of further candidates, see \a _fetch_following()
+	#  @return chosen \a Playlist or None if aborted by user
+	#
+	#  The "More" button pages through the remaining candidates.
+	def _select_batch(self, candidates, following=None):
+		columns = ["Playlist", "Tracks", "Description"]
+		start = 0
+		while True:
+			page = candidates[start:start + batch_size]
+			rows = [[pl.name, pl.total, pl.description] for pl in page]
+			rest = start + batch_size < len(candidates)
+			prompt = "Suggestions %d-%d of %d:" %(start + 1, start + len(page), len(candidates))
+
+			choice = self._ui.choose(prompt, columns, rows, "More" if rest or following is not None else "")
+			if choice is None:
+				return None
+			if choice != ui.MORE:
+				return page[choice]
+			self._reject(page)
+
+			if not rest:
+				added = self._extend(candidates, following)
+				following = None
+				if not added:
+					continue
+			start += batch_size
+
+	## Suggest one playlist at a time until user accepts one
+	#  @param candidates list of \a Playlist records in order of suggestion
+	#  @param following future of further candidates, see \a _fetch_following()
+	#  @return accepted \a Playlist or None if aborted by user
+	def _select_single(self, candidates, following=None):
 		i = 0
-		l = len(playlists)
-
-		while not accepted:
-			
+		while i < len(candidates) or self._extend(candidates, following):
 			if (i > 0 ) and ((i % 10) == 0):
 				if self._ui.question("You did not accept 10 times now, want to abort altogether?"):
-					break
-			
-			i += 1
-			idx = int(random.random() * l)
-			pl = playlists[idx]
-			name = self._fix_pango_markup(pl['name'])
-			desc = self._fix_pango_markup("~ "+pl['description']+" ~" if (pl['description'] != "") else "")
-			suggestion = "I suggest you listen to <b>%s</b> with %d tracks.\n%s\n\nOkay?" %(name, pl['tracks']['total'], desc)
+					return None
 
-			if self._ui.question(suggestion):
-				accepted = True
+			pl = candidates[i]
+			name = ui.escape(pl.name)
+			desc = ui.escape("~ "+pl.description+" ~" if (pl.description != "") else "")
+			suggestion = "I suggest you listen to <b>%s</b> with %d tracks.\n%s\n\nOkay?" %(name, pl.total, desc)
 
-		if accepted:
-			self._log.dbg("got playlist index %d: %s" %(idx, name))
-			self._log.dbg(pl['external_urls']['spotify'])
-			return pl['external_urls']['spotify']
-		else:
-			self._log.err("user aborted")
-			return None
+			if self._ui.question(suggestion):
+				return pl
+			self._reject([pl])
+			i += 1
+		return None
 
-	## Replace illegal chars with their escaped counterpart
-	def _fix_pango_markup(self, text):
-		return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace("''", "&#39;")
+	## Remember playlists as rejected by the user
+	#  @param playlists list of \a Playlist records
+	def _reject(self, playlists):
+		if self._history is not None:
+			self._history.reject(playlists)
 
+	## Add prefetched search results to the candidates
+	#  @param candidates list of \a Playlist records in order of suggestion
+	#  @param following future of further candidates, or None
+	#  @return True if candidates were added, else False
+	#
+	#  Waits for the prefetch to finish, if it has not yet.
+	def _extend(self, candidates, following):
+		if following is None:
+			return False
+		known = set(pl.id for pl in candidates)
+		added = [pl for pl in following.result() or [] if pl.id not in known]
+		self._log.dbg("%d more playlists prefetched" %(len(added)))
+		candidates.extend(self._shuffle(added))
+		return len(added) > 0
+
+	## Get the search results following the first \a depth ones
+	#  @param words list of keywords
+	#  @param stop callable returning True once prefetching was cancelled
+	#  @return list of \a Playlist records, or None if no playlists found
+	def _fetch_following(self, words, stop):
+		results = []
+		for word in words:
+			if stop():
+				return None
+			res = self._fetch_page(word, self.depth, min(page_size, max_depth - self.depth), scheduler.PREFETCH)
+			items = [] if res.get('error') or not res.get('playlists') else res.get('playlists').get('items') or []
+			results.append([Playlist.from_json(item) for item in items if item])
+
+		lists = self._merge(words, results)
+		if lists is not None and self._index is not None:
+			self._index.add(lists)
+		return lists
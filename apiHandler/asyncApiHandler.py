@@ -0,0 +1,163 @@
+## @package asyncApiHandler
+#  asyncio variant of the spotify API client
+#
+#  Requires the optional aiohttp module.
+#  Authorization is shared with the blocking client through \a authorize.Auth,
+#  its blocking calls are run in worker threads.
+#
+#  Requests do not pass the blocking client's scheduler and pipeline,
+#  so there is no client-side rate limiting and no circuit breaker.
+#  Rate-limited and unauthorized requests are retried once, callers
+#  sending many requests at once should limit their concurrency.
+
+import asyncio
+import aiohttp
+
+# own
+from apiHandler import apiHandler
+from apiHandler.auth import authorize
+from apiHandler.playlist import Playlist
+from apiHandler.util import log, transport
+
+## Enable debug logging
+debug = False
+
+## Maximum number of connections per host of a session created by the client
+connection_limit = 10
+
+## Longest Retry-After in seconds that is waited for instead of giving up
+max_retry_after = 30
+
+
+## Create a session suitable to share between clients
+#  @return aiohttp.ClientSession with pooled connections and default timeouts
+def session():
+	connect, read = transport.default_timeout
+	return aiohttp.ClientSession(
+		connector=aiohttp.TCPConnector(limit_per_host=connection_limit),
+		timeout=aiohttp.ClientTimeout(sock_connect=connect, sock_read=read))
+
+
+## @class AsyncApiHandler
+#  Handle interaction with the spotify API from asyncio code
+#
+#  One client serves one user. To run requests of many users
+#  concurrently on one event loop, create a client per user
+#  sharing one \a Auth and one session:
+#
+#      auth = authorize.Auth(lazy=True)
+#      async with asyncApiHandler.session() as s:
+#          clients = [AsyncApiHandler(u, auth, s) for u in auth.valid_users()]
+#          playing = await asyncio.gather(*(c.current_playing() for c in clients))
+class AsyncApiHandler:
+
+	## Constructor
+	#  @param user user id
+	#  @param auth \a authorize.Auth instance [default: new lazy instance]
+	#  @param session aiohttp.ClientSession [default: own session]
+	def __init__(self, user, auth=None, session=None):
+		self._log = log.log(self.__class__.__name__, debug)
+		self._log.dbg("hello from async playlist fetcher")
+
+		self._user = str(user)
+		self._auth = authorize.Auth(lazy=True) if auth is None else auth
+		self._session = session
+		self._own_session = session is None
+
+	async def __aenter__(self):
+		return self
+
+	async def __aexit__(self, *exc):
+		await self.close()
+
+	## Close the client's session, unless it was passed in
+	async def close(self):
+		if self._own_session and self._session is not None:
+			await self._session.close()
+			self._session = None
+
+
+	## Send a request with the user's access token
+	#  @param method HTTP method
+	#  @param url request url
+	#  @return the decoded response if API call was successful, else an object containing error code
+	#
+	#  A rejected token is refreshed once through \a Auth.refresh(),
+	#  a rate limited request is retried once after waiting.
+	#  If spotify or its accounts service cannot be reached, the error is
+	#  \a APIErrorCodes.unavailable, as with the blocking client.
+	async def _request(self, method, url, **kwargs):
+		if self._session is None:
+			self._session = session()
+
+		try:
+			token = await asyncio.to_thread(self._auth.access_token, self._user)
+			for attempt in range(2):
+				headers = {'Authorization': f"Bearer {token}"}
+				async with self._session.request(method, url, headers=headers, **kwargs) as response:
+					status = response.status
+					self._log.dbg("%s %s: %d" %(method, url, status))
+					if status == apiHandler.APIErrorCodes.ok:
+						return await response.json()
+					retry_after = float(response.headers.get('Retry-After', 1))
+
+				if attempt > 0:
+					break
+				if status == apiHandler.APIErrorCodes.expired_access:
+					if not await asyncio.to_thread(self._auth.refresh, self._user, token):
+						self._log.err("Could not refresh access token for user %s" %(self._user))
+						break
+					token = await asyncio.to_thread(self._auth.access_token, self._user)
+				elif status == apiHandler.APIErrorCodes.too_many and retry_after <= max_retry_after:
+					await asyncio.sleep(retry_after)
+				else:
+					break
+		except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+			# requests' and most of aiohttp's exceptions derive from IOError
+			self._log.dbg("%s %s failed: %s" %(method, url, e))
+			return {'error': apiHandler.APIErrorCodes.unavailable}
+
+		return {'error': status}
+
+
+	## Search playlists
+	#  @param keyword search term
+	#  @param limit number of playlists to return (max. 50)
+	#  @param offset index of the first playlist to return
+	#  @return list of \a Playlist records, or None on error
+	async def search(self, keyword, limit=apiHandler.page_size, offset=0):
+		params = {'q': keyword, 'type': 'playlist', 'market': apiHandler.market, 'offset': offset, 'limit': limit}
+		res = await self._request('GET', "https://api.spotify.com/v1/search", params=params)
+		if res.get('error') or not res.get('playlists'):
+			return None
+		return [Playlist.from_json(item) for item in res.get('playlists').get('items') or [] if item]
+
+	## Get currently playing track
+	#  @return tuple containing playback status and 'artist - song name' as string
+	async def current_playing(self):
+		params = {'additional_types': 'episode', 'market': apiHandler.market}
+		res = await self._request('GET', "https://api.spotify.com/v1/me/player/currently-playing", params=params)
+		if res.get('error') or res.get('item') is None:
+			return (None, None)
+		return (res.get('is_playing'), apiHandler.describe(res.get('item')))
+
+	## Get the user's Connect devices
+	#  @return list of devices, or None on error
+	async def devices(self):
+		res = await self._request('GET', "https://api.spotify.com/v1/me/player/devices")
+		if res.get('error'):
+			return None
+		return res.get('devices') or []
+
+	## Start playback
+	#  @param context_uri spotify uri of e.g. a playlist [default: resume]
+	#  @param device_id device to play on [default: active device]
+	#  @return True if playback started, else False
+	#
+	#  @note This requires a premium spotify account.
+	async def play(self, context_uri=None, device_id=None):
+		params = {'device_id': device_id} if device_id else None
+		body = {'context_uri': context_uri} if context_uri else None
+		res = await self._request('PUT', "https://api.spotify.com/v1/me/player/play", params=params, json=body)
+		# a successful call answers 204 no content
+		return res.get('error') in (None, apiHandler.APIErrorCodes.no_content)
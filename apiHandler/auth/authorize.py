@@ -7,19 +7,34 @@
 #  \a Auth is designed for outside use.
 
 
-import requests, json, os
-from apiHandler.util import log, ui
+import json, os, time, shutil, fcntl, threading
+from contextlib import contextmanager
+from apiHandler.util import log, ui, scheduler
 
 ## Enable debug logging
 debug = True
 
+## Seconds before a token's expiry at which it is no longer trusted locally
+expiry_margin = 60
+
+## Seconds before a token's expiry at which it is renewed in the background
+refresh_ahead = 300
+
+## Seconds to wait before retrying a failed background renewal
+refresh_retry = 60
+
+## Maximum number of users authorized concurrently
+auth_workers = 4
+
 ## @class Creds
 #  Handle credential storage
 #
 #  The \a Creds class is a helper class of \a Auth.  
 #  It handles the storage and retrieval of credentials on disk.
 #  If no existing credential storage file is found,
-#  an empty file is created for the user to fill with their data.
+#  an empty file is created for the user to fill with their data.  
+#  Changed values are tracked and only written when something changed,
+#  all changes inside a \a transaction() are written at once.
 class Creds:
 
 	## Constructor
@@ -29,6 +44,10 @@ class Creds:
 		self._log.dbg("hello from credential")
 		self._data = None
 		self._credfile = file
+		self._lock = threading.RLock()
+		self._dirty = set()
+		self._depth = 0
+		self._backup = False
 		self._init()
 		self._print()
 
@@ -44,11 +63,72 @@ class Creds:
 		return dat
 
 	## Store active credentials to file
+	#
+	#  Does nothing unless values changed or the file does not exist yet.
+	#  Under an exclusive lock, changed values are merged into the file's
+	#  current content, which is then atomically replaced. Before the first
+	#  write of a process, the previous file is kept as a backup.
 	def _print(self):
-		if os.path.isfile(self._credfile):
-			os.rename(self._credfile, "%s.bak" %(self._credfile))
-		with open(self._credfile, 'w') as f:
-			f.write(json.dumps(self._data, indent=2))
+		with self._lock:
+			if len(self._dirty) == 0 and os.path.isfile(self._credfile):
+				return
+
+			with open("%s.lock" %(self._credfile), 'a') as lock:
+				fcntl.flock(lock, fcntl.LOCK_EX)
+
+				data = self._data
+				if os.path.isfile(self._credfile):
+					try:
+						data = self._parse(self._credfile)
+					except ValueError:
+						self._log.err("credentials file is corrupt, overwriting")
+						data = self._data
+					else:
+						if not self._backup:
+							shutil.copyfile(self._credfile, "%s.bak" %(self._credfile))
+							self._backup = True
+						for user, key in self._dirty:
+							data['auth'].setdefault(user, {})[key] = self._data['auth'][user][key]
+
+				tmp = "%s.tmp" %(self._credfile)
+				fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+				with os.fdopen(fd, 'w') as f:
+					f.write(json.dumps(data, indent=2))
+					f.flush()
+					os.fsync(f.fileno())
+				os.replace(tmp, self._credfile)
+
+			self._log.dbg("stored %d changed values" %(len(self._dirty)))
+			self._data = data
+			self._dirty.clear()
+
+	## Set a user's value and store it unless inside a transaction
+	#  @param user user id
+	#  @param key credential name
+	#  @param data new value
+	def _set(self, user, key, data):
+		with self._lock:
+			if self._data['auth'][user].get(key) == data:
+				return
+			self._data['auth'][user][key] = data
+			self._dirty.add((user, key))
+			if self._depth == 0:
+				self._print()
+
+	## Group changes into a single write
+	#
+	#  Use as context manager, changes are stored when the
+	#  outermost transaction ends.
+	@contextmanager
+	def transaction(self):
+		with self._lock:
+			self._depth += 1
+			try:
+				yield self
+			finally:
+				self._depth -= 1
+				if self._depth == 0:
+					self._print()
 
 	## Initialize credential storage
 	#
@@ -72,7 +152,8 @@ class Creds:
 				'client_secret': '',
 				'code': '',
 				'auth_token': '',
-				'refresh_token': ''
+				'refresh_token': '',
+				'expires_at': 0
 			}
 
 		self._data = data
@@ -97,8 +178,7 @@ class Creds:
 	# This method acts as a getter if no \a data is provided.
 	def access_token(self, user, data=None):
 		if data is not None:
-			self._data['auth'][user]['auth_token'] = data
-			self._print()
+			self._set(user, 'auth_token', data)
 		return self._data['auth'][user]['auth_token']
 
 
@@ -110,11 +190,22 @@ class Creds:
 	# This method acts as a getter if no \a data is provided.
 	def refresh_token(self, user, data=None):
 		if data is not None:
-			self._data['auth'][user]['refresh_token'] = data
-			self._print()
+			self._set(user, 'refresh_token', data)
 		return self._data['auth'][user]['refresh_token']
 
 
+	## Get/Set a user's access token expiry time
+	#  @param user user id
+	#  @param data new value as unix timestamp (optional)
+	#  @return current/new value, 0 if unknown
+	#
+	# This method acts as a getter if no \a data is provided.
+	def expires_at(self, user, data=None):
+		if data is not None:
+			self._set(user, 'expires_at', data)
+		return self._data['auth'][user].get('expires_at', 0)
+
+
 	## Get/Set a user's access code
 	#  @param user user id
 	#  @param data new value (optional)
@@ -123,8 +214,7 @@ class Creds:
 	# This method acts as a getter if no \a data is provided.
 	def code(self, user, data=None):
 		if data is not None:
-			self._data['auth'][user]['code'] = data
-			self._print()
+			self._set(user, 'code', data)
 		return self._data['auth'][user]['code']
 
 
@@ -136,8 +226,7 @@ class Creds:
 	# This method acts as a getter if no \a data is provided.
 	def client_id(self, user, data=None):
 		if data is not None:
-			self._data['auth'][user]['client_id'] = data
-			self._print()
+			self._set(user, 'client_id', data)
 		return self._data['auth'][user]['client_id']
 
 
@@ -149,8 +238,7 @@ class Creds:
 	# This method acts as a getter if no \a data is provided.
 	def client_secret(self, user, data=None):
 		if data is not None:
-			self._data['auth'][user]['client_secret'] = data
-			self._print()
+			self._set(user, 'client_secret', data)
 		return self._data['auth'][user]['client_secret']
 
 
@@ -161,24 +249,36 @@ class Auth:
 
 	## Constructor
 	#  @param file credential file path [default: script location]
+	#  @param lazy only authorize a user on first use of its access token
+	#  @param http transport for all requests [default: shared scheduler]
 	#
-	#  Any stored credentials are read, updated and sorted into lists.
-	def __init__(self, file=None):
+	#  Any stored credentials are read, updated and sorted into lists.  
+	#  In \a lazy mode, no user is authorized up front and
+	#  \a valid_users() is based on local credential data alone.
+	def __init__(self, file=None, lazy=False, http=None):
 		self._log = log.log(self.__class__.__name__, debug)
 		self._log.dbg("hello from Auth")
 
 		self._file = "%s/.cred" %(os.path.split(os.path.realpath(__file__))[0]) if file is None else file
 		self._log.dbg("using credentials file: %s" %(self._file))
 
-		self._ui = ui.Ui()
+		self._ui = ui.Ui(links=True)
+		self._http = scheduler.shared() if http is None else http
 		self._creds = Creds(self._file)
 		self._users = {}
 		self._users['unauthorized'] = []
 		self._users['authorized'] = []
 		self._users['all'] = []
+		self._lazy = lazy
+		self._lazy_lock = threading.Lock()
+		self._ui_lock = threading.Lock()
+		self._flights = {}
+		self._flight_lock = threading.Lock()
+		self._timers = {}
 		if self._check_data() == 0:
 			self._log.err("No usable credentials found")
-		self._update_users()
+		if not self._lazy:
+			self._update_users()
 
 
 	## Get user ids from credential storage
@@ -204,31 +304,67 @@ class Auth:
 	# Sort users into authorized and unauthorized (i.e. unusable) users.  
 	# This checks if the stored credentials can make an API requests,
 	# if not, authentication is attempted 3 times or until success.  
-	# Users are then sorted into valid and invalid accounts.
+	# Users are then sorted into valid and invalid accounts.  
+	# Users are authorized concurrently, only dialogs asking
+	# for access codes are shown one after another.
 	#  @note This function updates the self._users dataset 
 	def _update_users(self):
 		self._log.dbg("updating user status")
-		for user in self._users['all']:
-				status = self.authorize(user)
-				if status:
-					self._users['authorized'].append(user)
-				else:
-					self._users['unauthorized'].append(user)
-				desc = "%s: %s" %(user, 'valid' if status else 'invalid')
-				self._log.dbg(desc)
+		users = self._users['all']
+		if len(users) == 0:
+			return
+
+		from concurrent.futures import ThreadPoolExecutor
+		with ThreadPoolExecutor(max_workers=min(auth_workers, len(users))) as pool:
+			statuses = list(pool.map(self.authorize, users))
+
+		for user, status in zip(users, statuses):
+				self._sort_user(user, status)
+
+
+	## Sort a user into authorized or unauthorized users
+	#  @param user id
+	#  @param status True if user is authorized, else False
+	def _sort_user(self, user, status):
+		if status:
+			self._users['authorized'].append(user)
+		else:
+			self._users['unauthorized'].append(user)
+		desc = "%s: %s" %(user, 'valid' if status else 'invalid')
+		self._log.dbg(desc)
+
+
+	## Authorize a user on first use
+	#  @param user id
+	#
+	#  Does nothing if the user's status is already known.
+	def _authorize_lazy(self, user):
+		with self._lazy_lock:
+			if user in self._users['authorized'] or user in self._users['unauthorized']:
+				return
+			self._log.dbg("lazily authorizing user %s" %(user))
+			self._sort_user(user, self.authorize(user))
 
 
 	## Check if user is authorized
 	#  @param user id
 	#  @return True if user credentials are authorized, else False
+	#
+	#  A token with a known expiry time is judged locally,
+	#  only tokens of unknown age are probed against the API.
 	def _is_authorized(self, user):
 		""" Return True is the user has valid credentials, else False """
+		if self._creds.access_token(user) != '' and self._creds.expires_at(user):
+			valid = self._creds.expires_at(user) - expiry_margin > time.time()
+			self._log.dbg("user %s has %s access token" %(user, 'valid' if valid else 'expired'))
+			return valid
+
 		if self._creds.access_token(user) != '':
 			# check if token is valid
 			url = "https://api.spotify.com/v1/search?q=lofi&type=playlist"
 			headers = {'Authorization': f"Bearer {self._creds.access_token(user)}"}
 
-			response = requests.get(url, headers=headers)
+			response = self._http.get(url, headers=headers)
 			res = response.json()
 
 			if res.get('error'):
@@ -252,16 +388,16 @@ class Auth:
 			'client_secret' : self._creds.client_secret(user)
 		}
 
-		res = requests.post('https://accounts.spotify.com/api/token', auth=(self._creds.client_id(user), self._creds.client_secret(user)), data=payload)
+		res = self._http.post('https://accounts.spotify.com/api/token', auth=(self._creds.client_id(user), self._creds.client_secret(user)), data=payload)
 		res_data = res.json()
 
 		if res_data.get('error') or res.status_code != 200:
 			self._log.dbg('Failed to receive token: %s' %(res_data.get('error', 'No error information received.')))
 			return False
 
-		json.dumps(res_data, indent=2)
-		self._creds.access_token(user, data=res_data.get('access_token'))
-		self._creds.refresh_token(user, data='')
+		with self._creds.transaction():
+			self._store_tokens(user, res_data)
+			self._creds.refresh_token(user, data='')
 		return True
 
 
@@ -274,12 +410,14 @@ class Auth:
 		auth_url = "https://accounts.spotify.com/authorize?client_id=%s&amp;response_type=code&amp;redirect_uri=%s&amp;scope=%s" %(self.client_id(user), redirect, scope)
 		req = "Please click <a href='%s'>this link</a> to give the required permissions to use this program.  \nWhen you're done, lick ok here and copy the part after data= into the next field:" %(auth_url)
 		
-		if not self._ui.question(req):
-			return False
-		
-		code = self._ui.get_input("enter the url part after 'data='")
-		if code is None:
-			return False
+		# users may be authorized concurrently, but only one may be asked at a time
+		with self._ui_lock:
+			if not self._ui.question("%s: %s" %(user, req)):
+				return False
+
+			code = self._ui.get_input("%s: enter the url part after 'data='" %(user))
+			if code is None:
+				return False
 
 		if self._creds.code(user, data=code) != code:
 			self._log.err("failed to update access code")
@@ -301,15 +439,16 @@ class Auth:
 			'redirect_uri': 'http://localhost:2112/',
 		}
 
-		res = requests.post('https://accounts.spotify.com/api/token', auth=(self._creds.client_id(user), self._creds.client_secret(user)), data=payload)
+		res = self._http.post('https://accounts.spotify.com/api/token', auth=(self._creds.client_id(user), self._creds.client_secret(user)), data=payload)
 		res_data = res.json()
 
 		if res_data.get('error') or res.status_code != 200:
 			self._log.dbg('Failed to receive token: %s' %(res_data.get('error', 'No error information received.')))
 			return False
 
-		self._creds.access_token(user, data=res_data.get('access_token'))
-		self._creds.refresh_token(user, data=res_data.get('refresh_token'))
+		with self._creds.transaction():
+			self._store_tokens(user, res_data)
+			self._creds.refresh_token(user, data=res_data.get('refresh_token'))
 		return True
 
 
@@ -326,17 +465,76 @@ class Auth:
 			'refresh_token': self._creds.refresh_token(user)
 		}
 
-		res = requests.post('https://accounts.spotify.com/api/token', auth=(self._creds.client_id(user), self._creds.client_secret(user)), data=payload)
+		res = self._http.post('https://accounts.spotify.com/api/token', auth=(self._creds.client_id(user), self._creds.client_secret(user)), data=payload)
 		res_data = res.json()
 
 		if res_data.get('error') or res.status_code != 200:
 			self._log.dbg('Failed to refresh token: %s' %(res_data.get('error', 'No error information received.')))
 			return False
 
-		json.dumps(res_data, indent=2)
-		self._creds.access_token(user, data=res_data.get('access_token'))
+		with self._creds.transaction():
+			self._store_tokens(user, res_data)
+			if res_data.get('refresh_token'):
+				self._creds.refresh_token(user, data=res_data.get('refresh_token'))
 		return True
-		
+
+
+	## Store access token and its expiry time from a token response
+	#  @param user id
+	#  @param res_data decoded token endpoint response
+	def _store_tokens(self, user, res_data):
+		with self._creds.transaction():
+			self._creds.access_token(user, data=res_data.get('access_token'))
+			expires_in = res_data.get('expires_in')
+			self._creds.expires_at(user, data=time.time() + expires_in if expires_in else 0)
+		if user in self._timers:
+			self._schedule_refresh(user)
+
+
+	## Renew a user's access token without user interaction
+	#  @param user id
+	#  @return True if a new access token was stored, else False
+	def _renew(self, user):
+		if self._creds.refresh_token(user) != '':
+			return self._refresh_access_tokens(user)
+		elif self._creds.access_token(user) != '':
+			return self._get_access_token_oneshot(user)
+		return False
+
+
+	## Schedule the background renewal of a user's access token
+	#  @param user id
+	#  @param delay seconds until renewal [default: shortly before expiry]
+	def _schedule_refresh(self, user, delay=None):
+		if delay is None:
+			expires = self._creds.expires_at(user)
+			if not expires:
+				self._log.dbg("expiry of user %s unknown, not refreshing ahead" %(user))
+				return
+			delay = max(0, expires - refresh_ahead - time.time())
+
+		timer = threading.Timer(delay, self._refresh_due, args=(user,))
+		timer.daemon = True
+		old = self._timers.get(user)
+		self._timers[user] = timer
+		if old is not None:
+			old.cancel()
+		timer.start()
+		self._log.dbg("refreshing token of user %s in %ds" %(user, delay))
+
+	## Renew a user's access token when its timer is due
+	#  @param user id
+	def _refresh_due(self, user):
+		try:
+			renewed = self.refresh(user, interactive=False)
+		except Exception as e:
+			# e.g. no network, keep the timer alive
+			self._log.dbg("renewing access token of user %s failed: %s" %(user, e))
+			renewed = False
+		if not renewed:
+			self._log.err("could not renew access token of user %s, retrying" %(user))
+			self._schedule_refresh(user, refresh_retry)
+
 	# PUBLIC
 
 	## Print all known users' ids, authorized or not
@@ -346,7 +544,12 @@ class Auth:
 
 	## Return list of authorized users' ids
 	#  @return list of usable user ids
+	#
+	#  In lazy mode, this returns all users with sufficient
+	#  credential data which are not known to be unauthorized.
 	def valid_users(self):
+		if self._lazy:
+			return [user for user in self._users['all'] if user not in self._users['unauthorized']]
 		return self._users['authorized']
 
 
@@ -367,8 +570,71 @@ class Auth:
 	#  @param user id
 	#  @return user's auth_token
 	def access_token(self, user):
+		if self._lazy:
+			self._authorize_lazy(user)
 		return self._creds.access_token(user)
 
+	## Refresh a user's access token, once for all concurrent callers
+	#  @param user id
+	#  @param stale access token rejected by the API (optional)
+	#  @param interactive allow asking the user for a new access code
+	#  @return True if the user has a valid access token afterwards, else False
+	#
+	#  Only one refresh per user runs at a time, callers arriving
+	#  while it runs wait for it and share its result.
+	#  If \a stale is given but was already replaced, nothing is refreshed.  
+	#  Non-interactive refreshes always renew the token, e.g. ahead of expiry.
+	def refresh(self, user, stale=None, interactive=True):
+		with self._flight_lock:
+			if stale is not None and self._creds.access_token(user) != stale:
+				self._log.dbg("token of user %s was already refreshed" %(user))
+				return True
+			flight = self._flights.get(user)
+			leader = flight is None
+			if leader:
+				flight = {'done': threading.Event(), 'result': False}
+				self._flights[user] = flight
+
+		if not leader:
+			self._log.dbg("waiting for running refresh of user %s" %(user))
+			flight['done'].wait()
+			return flight['result']
+
+		try:
+			if stale is not None:
+				self.invalidate(user)
+			flight['result'] = self.authorize(user) if interactive else self._renew(user)
+		finally:
+			with self._flight_lock:
+				del self._flights[user]
+			flight['done'].set()
+		return flight['result']
+
+
+	## Keep a user's access token renewed in the background
+	#  @param user id
+	#
+	#  The token is renewed \a refresh_ahead seconds before it expires,
+	#  so requests never have to wait for a refresh.
+	def start_refresh_ahead(self, user):
+		self._schedule_refresh(user)
+
+	## Stop all background token renewal
+	def stop_refresh_ahead(self):
+		for timer in self._timers.values():
+			timer.cancel()
+		self._timers.clear()
+
+
+	## Mark a user's access token as expired
+	#  @param user id
+	#
+	#  Call this when the API rejected the token,
+	#  so the next \a authorize() does not trust it locally.
+	def invalidate(self, user):
+		self._log.dbg("invalidating access token of user %s" %(user))
+		self._creds.expires_at(user, data=time.time())
+
 	## Try to authorize a user from stored credentials
 	#  @param user user id
 	#  @return True if user is authorized, else False
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+
+## @package daemon
+#  Serve chillfindr requests from a long-running process
+#
+#  The \a Server keeps one \a ApiHandler warm, i.e. its tokens,
+#  pooled connections and search cache, and answers requests
+#  sent by a \a Client over a local unix socket.
+#  Requests and responses are single lines of json.
+
+import json, os, socket, socketserver, stat
+# own
+from apiHandler.util import log, paths
+
+## Enable debug logging
+debug = False
+
+## Seconds the client waits for the daemon to accept a connection
+connect_timeout = 0.2
+
+
+## Check if a socket path can be trusted
+#  @param path socket path
+#  @return True if it is a socket owned by the current user, else False
+#
+#  The socket may live in a shared temporary directory, where
+#  anyone could create a file of that name first.
+def _owned(path):
+	try:
+		st = os.lstat(path)
+	except OSError:
+		return False
+	return stat.S_ISSOCK(st.st_mode) and st.st_uid == os.getuid()
+
+
+## @class Client
+#  Forward requests to a running daemon
+#
+#  This module is imported before anything else on the client path,
+#  so it must not import the api handler or any third-party module.
+class Client:
+
+	## Constructor
+	#  @param path socket path [default: user's runtime directory]
+	def __init__(self, path=None):
+		self._log = log.log(self.__class__.__name__, debug)
+		self._path = paths.socket_file() if path is None else path
+
+	## Send a request to the daemon
+	#  @param request dict, see \a Server.handle()
+	#  @return response dict, or None if no daemon is reachable
+	def send(self, request):
+		if not os.path.exists(self._path):
+			return None
+		if not _owned(self._path):
+			self._log.err("ignoring %s, it is not a socket of the current user" %(self._path))
+			return None
+
+		sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		try:
+			sock.settimeout(connect_timeout)
+			sock.connect(self._path)
+			# answers may wait for user interaction
+			sock.settimeout(None)
+			with sock.makefile('rw') as f:
+				f.write(json.dumps(request) + '\n')
+				f.flush()
+				line = f.readline()
+		except OSError as e:
+			self._log.dbg("daemon not reachable: %s" %(e))
+			return None
+		finally:
+			sock.close()
+
+		if not line:
+			self._log.dbg("daemon closed connection")
+			return None
+		return json.loads(line)
+
+
+## @class _RequestHandler
+#  Read one request line and write one response line
+class _RequestHandler(socketserver.StreamRequestHandler):
+
+	def handle(self):
+		line = self.rfile.readline()
+		try:
+			request = json.loads(line)
+		except ValueError:
+			response = {'ok': False, 'error': 'malformed request'}
+		else:
+			try:
+				response = self.server.owner.handle(request)
+			except Exception as e:
+				response = {'ok': False, 'error': str(e)}
+		self.wfile.write((json.dumps(response) + '\n').encode())
+
+
+## @class Server
+#  Keep an api handler warm and serve requests on a unix socket
+#
+#  Requests are served one at a time, since most of them
+#  end up in a dialog the user has to answer anyway.
+class Server:
+
+	## Constructor
+	#  @param path socket path [default: user's runtime directory]
+	#  @param kwargs arguments passed on to \a ApiHandler
+	def __init__(self, path=None, **kwargs):
+		self._log = log.log(self.__class__.__name__, debug)
+		self._log.dbg("hello from daemon")
+
+		self._path = paths.socket_file() if path is None else path
+		self._kwargs = kwargs
+		self._handler = None
+
+
+	## Check if another daemon is already serving on the socket
+	#  @return True if the socket accepts connections, else False
+	def _running(self):
+		if not _owned(self._path):
+			return False
+		sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		try:
+			sock.connect(self._path)
+			return True
+		except OSError:
+			return False
+		finally:
+			sock.close()
+
+
+	## Handle a single request
+	#  @param request dict containing 'op' ('now' or 'playlist')
+	#  and, for playlists, optional 'query', 'depth', 'refresh', 'batch' and 'play'
+	#  @return response dict containing 'ok' and 'result' or 'error',
+	#  for played playlists also the 'device' playing
+	def handle(self, request):
+		self._log.dbg("request: %s" %(request))
+		op = request.get('op')
+
+		if op == 'now':
+			return {'ok': True, 'result': self._handler.get_current_playing()}
+		elif op == 'playlist':
+			from apiHandler import apiHandler
+			self._handler.keyword = request.get('query')
+			self._handler.depth = min(request.get('depth') or apiHandler.page_size, apiHandler.max_depth)
+			self._handler.refresh = bool(request.get('refresh'))
+			self._handler.batch = bool(request.get('batch', True))
+			link = self._handler.get_playlist()
+			if request.get('play') and link is not None:
+				return {'ok': True, 'result': link, 'device': self._handler.play(link)}
+			return {'ok': True, 'result': link}
+
+		return {'ok': False, 'error': "unknown operation: %s" %(op)}
+
+
+	## Run the daemon until interrupted
+	#  @return False if the daemon could not start, else True
+	#
+	#  The socket is removed on KeyboardInterrupt and SystemExit,
+	#  callers may map SIGTERM to the latter.
+	def serve(self):
+		from apiHandler import apiHandler
+
+		if self._running():
+			self._log.err("daemon already running on %s" %(self._path))
+			return False
+		if os.path.lexists(self._path) and not _owned(self._path):
+			self._log.err("%s exists and is not a socket of the current user" %(self._path))
+			return False
+
+		self._handler = apiHandler.ApiHandler(**self._kwargs)
+		if not self._handler.select_user():
+			self._log.err("no usable user config found")
+			return False
+		self._handler.keep_token_fresh()
+
+		if os.path.exists(self._path):
+			self._log.dbg("removing stale socket %s" %(self._path))
+			os.unlink(self._path)
+
+		server = socketserver.UnixStreamServer(self._path, _RequestHandler)
+		server.owner = self
+		os.chmod(self._path, 0o600)
+		self._log.log("listening on %s" %(self._path))
+
+		try:
+			server.serve_forever()
+		except KeyboardInterrupt:
+			self._log.log("shutting down")
+		finally:
+			server.server_close()
+			os.unlink(self._path)
+		return True
@@ -0,0 +1,63 @@
+## @package playlist
+#  Compact playlist records
+#
+#  Spotify's search returns full playlist objects including images,
+#  owner details and snapshot ids. Only the few fields used for
+#  selection, caching and indexing are kept.
+
+
+## @class Playlist
+#  Playlist record with just the fields chillfindr uses
+class Playlist:
+
+	__slots__ = ('id', 'name', 'description', 'owner', 'total', 'url', 'keywords')
+
+	## Constructor
+	#  @param id spotify playlist id
+	#  @param name playlist name
+	#  @param description playlist description
+	#  @param owner owner's display name
+	#  @param total number of tracks
+	#  @param url browser-callable playlist url
+	#  @param keywords list of search keywords which found the playlist (optional)
+	def __init__(self, id, name, description, owner, total, url, keywords=None):
+		self.id = id
+		self.name = name
+		self.description = description
+		self.owner = owner
+		self.total = total
+		self.url = url
+		self.keywords = [] if keywords is None else keywords
+
+	def __repr__(self):
+		return "<Playlist %s: %s (%d tracks)>" %(self.id, self.name, self.total)
+
+	## Create a record from a playlist object returned by spotify
+	#  @param item decoded playlist object
+	#  @return \a Playlist
+	@classmethod
+	def from_json(cls, item):
+		return cls(
+			item['id'],
+			item.get('name') or '',
+			item.get('description') or '',
+			(item.get('owner') or {}).get('display_name') or '',
+			(item.get('tracks') or {}).get('total', 0),
+			item['external_urls']['spotify'])
+
+	## Create a record from its stored form
+	#  @param row list as returned by \a to_row()
+	#  @return \a Playlist
+	@classmethod
+	def from_row(cls, row):
+		return cls(*row)
+
+	## Get the record's stored form
+	#  @return json-serializable list of all fields but keywords
+	def to_row(self):
+		return [self.id, self.name, self.description, self.owner, self.total, self.url]
+
+	## Get the playlist's spotify uri
+	@property
+	def uri(self):
+		return "spotify:playlist:%s" %(self.id)
@@ -0,0 +1,70 @@
+"""Compare memory and storage size of raw search results and Playlist records.
+
+Run with: python -m apiHandler.test.bench_playlist [count]
+"""
+
+import gc
+import json
+import sys
+import tracemalloc
+
+from apiHandler.playlist import Playlist
+
+_COUNT = 10000
+
+
+def _item(i):
+    """Return a playlist object shaped like spotify's search results."""
+    pid = '37i9dQZF1DX%011d' % i
+    return {
+        'collaborative': False,
+        'description': 'Chill beats to relax, study and work to &amp; more, number %d' % i,
+        'external_urls': {'spotify': 'https://open.spotify.com/playlist/%s' % pid},
+        'href': 'https://api.spotify.com/v1/playlists/%s' % pid,
+        'id': pid,
+        'images': [{'height': None, 'url': 'https://i.scdn.co/image/ab67706f0000000%09d' % i, 'width': None}],
+        'name': 'lofi chill %d' % i,
+        'owner': {
+            'display_name': 'user %d' % (i % 500),
+            'external_urls': {'spotify': 'https://open.spotify.com/user/user%d' % (i % 500)},
+            'href': 'https://api.spotify.com/v1/users/user%d' % (i % 500),
+            'id': 'user%d' % (i % 500),
+            'type': 'user',
+            'uri': 'spotify:user:user%d' % (i % 500),
+        },
+        'primary_color': None,
+        'public': True,
+        'snapshot_id': 'MTY4NjkxMjM0MCwwMDAwMDAwMGQ0MWQ4Y2Q5OGYwMGIyMDRlOTgwMDk5OGVjZjg0Mjdl%05d' % i,
+        'tracks': {'href': 'https://api.spotify.com/v1/playlists/%s/tracks' % pid, 'total': i % 300},
+        'type': 'playlist',
+        'uri': 'spotify:playlist:%s' % pid,
+    }
+
+
+def _measure(build):
+    """Return (objects, bytes allocated) of building objects."""
+    gc.collect()
+    tracemalloc.start()
+    objects = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return objects, size
+
+
+def main(count=_COUNT):
+    # decode from text, as the responses are
+    text = json.dumps([_item(i) for i in range(count)])
+
+    items, raw = _measure(lambda: json.loads(text))
+    records, compact = _measure(lambda: [Playlist.from_json(item) for item in json.loads(text)])
+
+    raw_json = len(json.dumps(items))
+    compact_json = len(json.dumps([pl.to_row() for pl in records]))
+
+    print("%d playlists" % count)
+    print("  memory   raw dicts: %8.1f KiB  records: %8.1f KiB  (%.1fx)" % (raw / 1024, compact / 1024, raw / compact))
+    print("  json     raw dicts: %8.1f KiB  records: %8.1f KiB  (%.1fx)" % (raw_json / 1024, compact_json / 1024, raw_json / compact_json))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else _COUNT)
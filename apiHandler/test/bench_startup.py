@@ -0,0 +1,57 @@
+"""Measure startup costs against the budgets the project commits to.
+
+Run with: python -m apiHandler.test.bench_startup
+
+Timings depend on the machine and its load, so they are checked here
+rather than in the unit tests.
+"""
+
+import os
+import tempfile
+import time
+
+from apiHandler.test.test_startup import _importtime
+from apiHandler.util import deps
+
+# milliseconds the dependency check may take on a cold and a cached run
+_COLD_CHECK_BUDGET_MS = 50
+_CACHED_CHECK_BUDGET_MS = 2
+
+# milliseconds importing the api handler may take, as reported by -X importtime
+_IMPORT_BUDGET_MS = 25
+
+_RUNS = 5
+
+
+def _timed_check():
+    """Return milliseconds of one dependency check."""
+    start = time.perf_counter()
+    deps.check()
+    return (time.perf_counter() - start) * 1000
+
+
+def _report(name, times, budget):
+    """Print the median of times against budget, return True if within it."""
+    ms = sorted(times)[len(times) // 2]
+    ok = ms < budget
+    print("%-16s %7.2f ms  budget %5.1f ms  %s" % (name, ms, budget, 'ok' if ok else 'OVER'))
+    return ok
+
+
+def main():
+    cold, cached, imports = [], [], []
+    for _ in range(_RUNS):
+        with tempfile.TemporaryDirectory() as cache:
+            os.environ['XDG_CACHE_HOME'] = cache
+            cold.append(_timed_check())
+            cached.append(_timed_check())
+        imports.append(_importtime('-c', 'import apiHandler.apiHandler')['apiHandler.apiHandler'] / 1000)
+
+    ok = _report('cold check', cold, _COLD_CHECK_BUDGET_MS)
+    ok = _report('cached check', cached, _CACHED_CHECK_BUDGET_MS) and ok
+    ok = _report('import', imports, _IMPORT_BUDGET_MS) and ok
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
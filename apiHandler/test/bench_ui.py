@@ -0,0 +1,31 @@
+"""Compare how fast the installed dialog backends show a dialog.
+
+Run with: python -m apiHandler.test.bench_ui
+
+Every prompt starts its backend's program once, so this is the
+latency added to each prompt. The result is stored, and from then
+on --ui=auto picks the fastest. Each measured backend briefly shows a dialog.
+"""
+
+import shutil
+
+from apiHandler.util import ui
+
+
+def main():
+    latency = ui.calibrate()
+    for name in ui.backends:
+        ms = latency.get(name)
+        if ui.backends[name].program is None:
+            print("%-10s no program to start" % name)
+        elif shutil.which(ui.backends[name].program) is None:
+            print("%-10s not installed" % name)
+        elif ms is None:
+            print("%-10s cannot be measured" % name)
+        else:
+            print("%-10s %7.1f ms" % (name, ms))
+    print("auto: %s, for prompts with links: %s" % (ui.fastest(), ui.fastest(links=True)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Stand-ins for HTTP responses and transports, shared by the tests."""
+
+import json
+import threading
+import time
+
+
+class Response:
+    """Minimal stand-in for requests.Response."""
+
+    def __init__(self, status_code, data=None, headers=None):
+        self.status_code = status_code
+        self.headers = dict(headers or {})
+        self._data = data
+        self.content = json.dumps(data).encode() if data is not None else b''
+
+    def json(self):
+        return self._data if self._data is not None else {}
+
+
+class Transport:
+    """Answer requests in order with the given answers, then with 200.
+
+    An answer is a Response, a status code, or an exception to raise.
+    Sent requests are recorded as (method, url, kwargs) in sent, and
+    their monotonic send times in times.
+    """
+
+    def __init__(self, *answers):
+        self._answers = list(answers)
+        self._lock = threading.Lock()
+        self.sent = []
+        self.times = []
+
+    def answer(self, method, url, **kwargs):
+        """Return the next answer, override to answer depending on the request."""
+        with self._lock:
+            return self._answers.pop(0) if self._answers else 200
+
+    def request(self, method, url, **kwargs):
+        with self._lock:
+            self.sent.append((method, url, kwargs))
+            self.times.append(time.monotonic())
+        answer = self.answer(method, url, **kwargs)
+        if isinstance(answer, Exception):
+            raise answer
+        return Response(answer) if isinstance(answer, int) else answer
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
@@ -0,0 +1,106 @@
+"""Test the asyncio client."""
+
+import unittest
+
+import aiohttp
+
+from apiHandler import asyncApiHandler
+
+
+class _Response:
+    """Stand-in for an aiohttp response, usable as async context manager."""
+
+    def __init__(self, status, data=None, headers=None):
+        self.status = status
+        self.headers = headers or {}
+        self._data = {} if data is None else data
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def json(self):
+        return self._data
+
+
+class _Session:
+    """Stand-in for aiohttp.ClientSession answering with prepared responses.
+
+    Answers may be responses, status codes or exceptions to raise,
+    requests beyond the prepared answers succeed.
+    """
+
+    def __init__(self, *answers):
+        self._answers = list(answers)
+        self.sent = []
+
+    def request(self, method, url, **kwargs):
+        self.sent.append((method, url, kwargs))
+        answer = self._answers.pop(0) if self._answers else _Response(200, {'devices': []})
+        if isinstance(answer, Exception):
+            raise answer
+        return _Response(answer) if isinstance(answer, int) else answer
+
+
+class _Auth:
+    """Stand-in for authorize.Auth handing out a new token on each refresh."""
+
+    def __init__(self):
+        self.token = 'old'
+        self.refreshes = 0
+
+    def access_token(self, user):
+        return self.token
+
+    def refresh(self, user, stale=None):
+        self.refreshes += 1
+        self.token = 'new'
+        return True
+
+
+class TestAsyncApiHandler(unittest.IsolatedAsyncioTestCase):
+    """Test requests of the asyncio client."""
+
+    def _client(self, *answers):
+        self.session = _Session(*answers)
+        self.auth = _Auth()
+        return asyncApiHandler.AsyncApiHandler('user', self.auth, self.session)
+
+    async def test_success(self):
+        """Test that a successful request returns the decoded response."""
+        client = self._client(_Response(200, {'devices': [{'id': 'phone'}]}))
+
+        self.assertEqual(await client.devices(), [{'id': 'phone'}])
+        self.assertEqual(self.session.sent[0][2]['headers']['Authorization'], 'Bearer old')
+
+    async def test_connection_error(self):
+        """Test that an unreachable server yields an error instead of raising."""
+        client = self._client(aiohttp.ClientConnectionError("connection refused"))
+
+        self.assertEqual(await client._request('GET', 'https://api.spotify.com/v1/me'), {'error': 503})
+        self.assertIsNone(await self._client(TimeoutError()).devices())
+
+    async def test_expired_token_refreshed(self):
+        """Test that a rejected token is refreshed once and the request retried."""
+        client = self._client(401)
+
+        self.assertEqual(await client.devices(), [])
+        self.assertEqual(self.auth.refreshes, 1)
+        self.assertEqual(self.session.sent[1][2]['headers']['Authorization'], 'Bearer new')
+
+    async def test_retry_after(self):
+        """Test that a rate limited request is retried after its Retry-After."""
+        client = self._client(_Response(429, headers={'Retry-After': '0.01'}))
+
+        self.assertEqual(await client.devices(), [])
+        self.assertEqual(len(self.session.sent), 2)
+
+    async def test_gives_up_after_one_retry(self):
+        """Test that the error of the retried request is returned."""
+        limited = {'Retry-After': '0.01'}
+        client = self._client(_Response(429, headers=limited), _Response(429, headers=limited))
+
+        self.assertEqual(await client._request('GET', 'https://api.spotify.com/v1/me'), {'error': 429})
+        self.assertEqual(len(self.session.sent), 2)
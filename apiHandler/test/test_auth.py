@@ -0,0 +1,136 @@
+"""Test storing credentials and refreshing access tokens."""
+
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from apiHandler.auth import authorize
+from apiHandler.test import fakes
+from apiHandler.util import pipeline
+
+_TOKEN_URL = 'https://accounts.spotify.com/api/token'
+
+
+class _Spotify(fakes.Transport):
+    """Fake api and accounts service, accepting only the newest token.
+
+    Token requests take a while, so concurrent callers overlap.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.token = None
+        self.refreshes = 0
+
+    def answer(self, method, url, **kwargs):
+        if url == _TOKEN_URL:
+            time.sleep(0.1)
+            with self._lock:
+                self.refreshes += 1
+                self.token = 'new%d' % self.refreshes
+                return fakes.Response(200, {'access_token': self.token, 'expires_in': 3600})
+        if kwargs['headers']['Authorization'] != 'Bearer %s' % self.token:
+            return fakes.Response(401, {'error': {'status': 401, 'message': 'The access token expired'}})
+        return 200
+
+
+class TestRefresh(unittest.TestCase):
+    """Test refreshing access tokens."""
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self._dir.cleanup)
+        self._file = os.path.join(self._dir.name, '.cred')
+        with open(self._file, 'w') as f:
+            json.dump({'urls': {}, 'auth': {'user': {
+                'client_id': 'id', 'client_secret': 'secret', 'code': 'code',
+                'auth_token': 'old', 'refresh_token': 'refresh', 'expires_at': time.time() + 3600,
+            }}}, f)
+        self.spotify = _Spotify()
+        self.auth = authorize.Auth(self._file, lazy=True, http=self.spotify)
+        self.addCleanup(self.auth.stop_refresh_ahead)
+
+    def test_burst_of_401_refreshes_once(self):
+        """Test that concurrent requests rejected with the same token cause a single refresh."""
+        pipe = pipeline.Pipeline(self.spotify, [pipeline.Authorization(self.auth, lambda: 'user')])
+        codes = []
+
+        def fetch():
+            codes.append(pipe.request('GET', 'https://api.spotify.com/v1/me').status_code)
+
+        threads = [threading.Thread(target=fetch) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(codes, [200] * 8)
+        self.assertEqual(self.spotify.refreshes, 1)
+        self.assertEqual(self.auth.access_token('user'), 'new1')
+
+    @mock.patch.object(authorize, 'refresh_retry', 0.05)
+    def test_refresh_ahead_survives_errors(self):
+        """Test that a background renewal which raised is retried."""
+        renew = mock.Mock(side_effect=[ConnectionError("no network"), True])
+        with mock.patch.object(self.auth, '_renew', renew):
+            self.auth._refresh_due('user')
+            deadline = time.monotonic() + 2
+            while renew.call_count < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+        self.assertEqual(renew.call_count, 2)
+
+
+class TestCreds(unittest.TestCase):
+    """Test storing credentials."""
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self._dir.cleanup)
+        self._file = os.path.join(self._dir.name, '.cred')
+        user = {'client_id': 'id', 'client_secret': 'secret', 'code': 'code',
+                'auth_token': 'old', 'refresh_token': 'refresh', 'expires_at': 0}
+        with open(self._file, 'w') as f:
+            json.dump({'urls': {}, 'auth': {'alice': dict(user), 'bob': dict(user)}}, f)
+
+    def _stored(self):
+        with open(self._file, 'r') as f:
+            return json.load(f)['auth']
+
+    def test_unchanged_not_written(self):
+        """Test that loading and setting unchanged values does not write the file."""
+        inode = os.stat(self._file).st_ino
+        creds = authorize.Creds(self._file)
+        creds.access_token('alice', data='old')
+        self.assertEqual(os.stat(self._file).st_ino, inode)
+
+    def test_transaction_writes_once(self):
+        """Test that all changes of a transaction are written at once."""
+        creds = authorize.Creds(self._file)
+        with mock.patch.object(authorize.os, 'replace', wraps=os.replace) as replace:
+            with creds.transaction():
+                creds.access_token('alice', data='new')
+                creds.expires_at('alice', data=1234)
+                with creds.transaction():
+                    creds.refresh_token('alice', data='refreshed')
+                self.assertEqual(replace.call_count, 0)
+        self.assertEqual(replace.call_count, 1)
+        self.assertEqual(self._stored()['alice']['auth_token'], 'new')
+        self.assertEqual(self._stored()['alice']['refresh_token'], 'refreshed')
+        self.assertEqual(os.stat(self._file).st_mode & 0o777, 0o600)
+
+    def test_concurrent_writers_merge(self):
+        """Test that changes of two processes are merged instead of overwriting each other."""
+        first = authorize.Creds(self._file)
+        second = authorize.Creds(self._file)
+        second.access_token('bob', data='bobs token')
+        first.access_token('alice', data='alices token')
+
+        stored = self._stored()
+        self.assertEqual(stored['alice']['auth_token'], 'alices token')
+        self.assertEqual(stored['bob']['auth_token'], 'bobs token')
+        self.assertTrue(os.path.isfile('%s.bak' % self._file))
@@ -0,0 +1,90 @@
+"""Test the persistent search cache."""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from apiHandler.util import cache
+
+
+class TestCache(unittest.TestCase):
+    """Test the persistent search cache."""
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self._dir.cleanup)
+        self.now = 1000000.0
+        patcher = mock.patch.object(cache, 'time')
+        patcher.start().time.side_effect = lambda: self.now
+        self.addCleanup(patcher.stop)
+
+    def _cache(self, **kwargs):
+        store = cache.Cache('test', directory=self._dir.name, **kwargs)
+        self.addCleanup(store.flush)
+        return store
+
+    def test_ttl_and_grace(self):
+        """Test that entries are fresh, then stale, then gone."""
+        store = self._cache(ttl=10, grace=20)
+        store.put('lofi', [1, 2])
+
+        self.assertEqual(store.get('lofi'), ([1, 2], True))
+        self.now += 15
+        self.assertEqual(store.get('lofi'), ([1, 2], False))
+        self.now += 20
+        self.assertEqual(store.get('lofi'), (None, False))
+        self.assertEqual(store.stats()['entries'], 0)
+
+    def test_lru_eviction(self):
+        """Test that the least recently used entries are evicted."""
+        store = self._cache(entries=2)
+        store.put('a', 1)
+        self.now += 1
+        store.put('b', 2)
+        self.now += 1
+        store.get('a')
+        self.now += 1
+        store.put('c', 3)
+
+        self.assertEqual(store.get('a'), (1, True))
+        self.assertEqual(store.get('b'), (None, False))
+        self.assertEqual(store.get('c'), (3, True))
+
+    def test_counters(self):
+        """Test that hits, stale hits and misses are counted and kept until written."""
+        store = self._cache(ttl=10)
+        store.get('lofi')
+        store.put('lofi', 1)
+        store.get('lofi')
+        self.now += 11
+        store.get('lofi')
+
+        self.assertEqual(store.stats(), {'hits': 1, 'stale': 1, 'misses': 1, 'entries': 1})
+        store.flush()
+        self.assertEqual(self._cache().stats(), {'hits': 1, 'stale': 1, 'misses': 1, 'entries': 1})
+
+    def test_lookup_does_not_write(self):
+        """Test that a lookup leaves the entry's content alone."""
+        store = self._cache()
+        store.put('lofi', 1)
+        path = store._path('lofi')
+        with mock.patch.object(store, '_write') as write:
+            store.get('lofi')
+        write.assert_not_called()
+        self.assertTrue(os.path.isfile(path))
+
+    def test_processes_share_entries(self):
+        """Test that caches of two processes neither lose entries nor counters of the other."""
+        first = self._cache()
+        second = self._cache()
+        first.get('a')
+        second.get('b')
+        first.put('a', 1)
+        second.put('b', 2)
+
+        self.assertEqual(first.get('b'), (2, True))
+        self.assertEqual(second.get('a'), (1, True))
+        first.flush()
+        second.flush()
+        self.assertEqual(self._cache().stats(), {'hits': 2, 'stale': 0, 'misses': 2, 'entries': 2})
@@ -0,0 +1,103 @@
+"""Test the local playlist index."""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from apiHandler.playlist import Playlist
+from apiHandler.util import index
+
+
+def _playlist(pid, name, description='', owner='someone'):
+    return Playlist(pid, name, description, owner, 10, 'https://open.spotify.com/playlist/%s' % pid)
+
+
+class TestOneEdit(unittest.TestCase):
+    """Test detecting words which differ by one edit."""
+
+    def test_edits(self):
+        """Test each kind of edit, and words differing by more."""
+        cases = [
+            ('jazz', 'jazz', True),
+            ('jazz', 'jaz', True),
+            ('jaz', 'jazz', True),
+            ('jazz', 'jizz', True),
+            ('study', 'sutdy', True),
+            ('study', 'sudty', False),
+            ('lofi', 'lo', False),
+            ('chill', 'chilled', False),
+            ('ambient', 'ambeint', True),
+        ]
+        for a, b, expected in cases:
+            with self.subTest(a=a, b=b):
+                self.assertEqual(index._one_edit(a, b), expected)
+
+
+class TestIndex(unittest.TestCase):
+    """Test the local playlist index."""
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self._dir.cleanup)
+        self._file = os.path.join(self._dir.name, 'index.json')
+
+    def _index(self, playlists):
+        idx = index.Index(self._file)
+        idx.add(playlists)
+        idx.flush()
+        return idx
+
+    def test_search(self):
+        """Test exact, prefix and typo matches, and that all query words must match."""
+        idx = self._index([
+            _playlist('a', 'lofi beats', 'to study to'),
+            _playlist('b', 'lofi jazz'),
+            _playlist('c', 'ambient', owner='lofigirl'),
+        ])
+        found = [pl.id for pl in idx.search('lofi')]
+        self.assertEqual(sorted(found[:2]), ['a', 'b'])
+        self.assertEqual(found[2:], ['c'])
+        self.assertEqual([pl.id for pl in idx.search('lofi jazz')], ['b'])
+        self.assertEqual([pl.id for pl in idx.search('studdy')], ['a'])
+        self.assertEqual(idx.search('techno'), [])
+
+    def test_update(self):
+        """Test that a playlist added again replaces its old words."""
+        idx = self._index([_playlist('a', 'lofi beats')])
+        idx.add([_playlist('a', 'jazz hop')])
+        idx.flush()
+        self.assertEqual(idx.search('lofi'), [])
+        self.assertEqual([pl.id for pl in idx.search('jazz')], ['a'])
+
+    def test_processes_share_file(self):
+        """Test that playlists added by two indexes of the same file are all kept."""
+        first = index.Index(self._file)
+        second = index.Index(self._file)
+        first.add([_playlist('a', 'lofi')])
+        first.flush()
+        second.add([_playlist('b', 'lofi')])
+        second.flush()
+        self.assertEqual(sorted(pl.id for pl in index.Index(self._file).search('lofi')), ['a', 'b'])
+
+    @mock.patch.object(index, 'max_docs', 2)
+    def test_size_limit(self):
+        """Test that the least recently found playlists are dropped beyond the limit."""
+        with mock.patch.object(index, 'time') as clock:
+            clock.time.side_effect = [100, 200, 300]
+            idx = self._index([_playlist('a', 'lofi')])
+            for pid in 'bc':
+                idx.add([_playlist(pid, 'lofi')])
+                idx.flush()
+        self.assertEqual(sorted(pl.id for pl in index.Index(self._file).search('lofi')), ['b', 'c'])
+
+    def test_age_limit(self):
+        """Test that playlists not found again for too long are dropped."""
+        old = 1000000.0
+        with mock.patch.object(index, 'time') as clock:
+            clock.time.return_value = old
+            self._index([_playlist('a', 'lofi')])
+        with mock.patch.object(index, 'time') as clock:
+            clock.time.return_value = old + index.max_age * 86400 + 1
+            self._index([_playlist('b', 'lofi')])
+        self.assertEqual([pl.id for pl in index.Index(self._file).search('lofi')], ['b'])
@@ -0,0 +1,100 @@
+"""Test the middleware of the request pipeline."""
+
+import time
+import unittest
+
+from apiHandler.test import fakes
+from apiHandler.util import pipeline
+
+
+class _Auth:
+    """Stand-in for authorize.Auth which cannot reach the accounts service."""
+
+    def access_token(self, user):
+        raise ConnectionError("accounts.spotify.com unreachable")
+
+    def refresh(self, user, stale=None):
+        raise ConnectionError("accounts.spotify.com unreachable")
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """Test that the circuit breaker stops requests to a failing server."""
+
+    def test_opens_after_threshold(self):
+        """Test that the breaker rejects requests after consecutive server errors."""
+        http = fakes.Transport(500, 500, 500)
+        pipe = pipeline.Pipeline(http, [pipeline.CircuitBreaker(threshold=2, cooldown=60)])
+
+        self.assertEqual(pipe.request('GET', 'https://api.spotify.com/v1/me').status_code, 500)
+        self.assertEqual(pipe.request('GET', 'https://api.spotify.com/v1/me').status_code, 500)
+        response = pipe.request('GET', 'https://api.spotify.com/v1/me')
+        self.assertIsInstance(response, pipeline.ErrorResponse)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(len(http.sent), 2)
+
+    def test_half_opens_after_cooldown(self):
+        """Test that one probe is sent after the cooldown and closes the breaker on success."""
+        http = fakes.Transport(500, 500)
+        pipe = pipeline.Pipeline(http, [pipeline.CircuitBreaker(threshold=2, cooldown=0.1)])
+        pipe.request('GET', 'https://api.spotify.com/v1/me')
+        pipe.request('GET', 'https://api.spotify.com/v1/me')
+
+        time.sleep(0.15)
+        self.assertEqual(pipe.request('GET', 'https://api.spotify.com/v1/me').status_code, 200)
+        self.assertEqual(pipe.request('GET', 'https://api.spotify.com/v1/me').status_code, 200)
+        self.assertEqual(len(http.sent), 4)
+
+    def test_failed_probe_reopens(self):
+        """Test that a failing probe opens the breaker for another cooldown."""
+        http = fakes.Transport(500, 500, 500)
+        pipe = pipeline.Pipeline(http, [pipeline.CircuitBreaker(threshold=2, cooldown=0.1)])
+        pipe.request('GET', 'https://api.spotify.com/v1/me')
+        pipe.request('GET', 'https://api.spotify.com/v1/me')
+
+        time.sleep(0.15)
+        self.assertEqual(pipe.request('GET', 'https://api.spotify.com/v1/me').status_code, 500)
+        self.assertEqual(pipe.request('GET', 'https://api.spotify.com/v1/me').status_code, 503)
+        self.assertEqual(len(http.sent), 3)
+
+
+class TestRetry(unittest.TestCase):
+    """Test that requests which did not reach the server are retried."""
+
+    def test_retries_connection_errors(self):
+        """Test that a connection error is retried."""
+        http = fakes.Transport(ConnectionError("reset"))
+        pipe = pipeline.Pipeline(http, [pipeline.Retry(retries=2)])
+
+        self.assertEqual(pipe.request('GET', 'https://api.spotify.com/v1/me').status_code, 200)
+        self.assertEqual(len(http.sent), 2)
+
+    def test_gives_up_with_error_response(self):
+        """Test that a 503 is returned instead of raising once all attempts failed."""
+        http = fakes.Transport(*[TimeoutError("timed out")] * 3)
+        pipe = pipeline.Pipeline(http, [pipeline.Retry(retries=2)])
+
+        response = pipe.request('GET', 'https://api.spotify.com/v1/me')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(len(http.sent), 3)
+
+
+class TestAuthorization(unittest.TestCase):
+    """Test that the authorization middleware survives an unreachable accounts service."""
+
+    def test_token_unreachable(self):
+        """Test that a failing token lookup yields a 503 without sending the request."""
+        http = fakes.Transport()
+        pipe = pipeline.Pipeline(http, [pipeline.Authorization(_Auth(), lambda: 'user')])
+
+        self.assertEqual(pipe.request('GET', 'https://api.spotify.com/v1/me').status_code, 503)
+        self.assertEqual(len(http.sent), 0)
+
+    def test_refresh_unreachable(self):
+        """Test that a failing refresh after a 401 yields a 503."""
+        auth = _Auth()
+        auth.access_token = lambda user: 'expired'
+        http = fakes.Transport(401)
+        pipe = pipeline.Pipeline(http, [pipeline.Authorization(auth, lambda: 'user')])
+
+        self.assertEqual(pipe.request('GET', 'https://api.spotify.com/v1/me').status_code, 503)
+        self.assertEqual(http.sent[0][2]['headers']['Authorization'], 'Bearer expired')
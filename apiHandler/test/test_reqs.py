@@ -1,12 +1,8 @@
 """Test availability of required packages."""
-# from: https://stackoverflow.com/a/45474387/240950
 
 import unittest
-from pathlib import Path
 
-import pkg_resources
-
-_REQUIREMENTS_PATH = Path(__file__).with_name("requirements.txt")
+from apiHandler.util import deps
 
 
 class TestRequirements(unittest.TestCase):
@@ -14,10 +10,8 @@ class TestRequirements(unittest.TestCase):
 
     def test_requirements(self):
         """Test that each required package is available."""
-        # Ref: https://stackoverflow.com/a/45474387/
-        requirements = pkg_resources.parse_requirements(_REQUIREMENTS_PATH.open())
-        for requirement in requirements:
-            requirement = str(requirement)
+        missing = deps.missing()
+        for requirement in deps.names():
             with self.subTest(requirement=requirement):
                 print("testing %s" %(requirement))
-                pkg_resources.require(requirement)
+                self.assertNotIn(requirement, missing)
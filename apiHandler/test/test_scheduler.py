@@ -0,0 +1,69 @@
+"""Test rate limiting and retries of the request scheduler."""
+
+import threading
+import time
+import unittest
+from unittest import mock
+
+from apiHandler.test import fakes
+from apiHandler.util import scheduler
+
+
+class TestScheduler(unittest.TestCase):
+    """Test rate limiting and retries of the request scheduler."""
+
+    def test_retry_after_pauses(self):
+        """Test that a 429 pauses requests for its Retry-After, then retries."""
+        http = fakes.Transport(fakes.Response(429, headers={'Retry-After': '0.2'}))
+        sched = scheduler.Scheduler(http=http)
+
+        self.assertEqual(sched.get('https://api.spotify.com/v1/search').status_code, 200)
+        self.assertEqual(len(http.sent), 2)
+        self.assertGreaterEqual(http.times[1] - http.times[0], 0.2)
+        self.assertEqual(sched.stats()['rate_limited'], 1)
+        self.assertEqual(sched.stats()['retried'], 1)
+
+    def test_retry_after_pauses_other_requests(self):
+        """Test that a 429 also holds back requests of other threads."""
+        http = fakes.Transport(fakes.Response(429, headers={'Retry-After': '0.2'}))
+        sched = scheduler.Scheduler(http=http)
+
+        first = threading.Thread(target=sched.get, args=('https://api.spotify.com/v1/a',))
+        first.start()
+        while len(http.sent) == 0:
+            time.sleep(0.01)
+        sched.get('https://api.spotify.com/v1/b')
+        first.join()
+
+        self.assertEqual(len(http.sent), 3)
+        self.assertGreaterEqual(http.times[1] - http.times[0], 0.2)
+
+    def test_long_retry_after_gives_up(self):
+        """Test that a 429 asking to wait too long is returned right away."""
+        retry_after = str(scheduler.max_retry_after + 1)
+        http = fakes.Transport(fakes.Response(429, headers={'Retry-After': retry_after}))
+        sched = scheduler.Scheduler(http=http)
+
+        self.assertEqual(sched.get('https://api.spotify.com/v1/search').status_code, 429)
+        self.assertEqual(len(http.sent), 1)
+
+    def test_bucket_throttles(self):
+        """Test that requests beyond the burst are spaced by the rate."""
+        http = fakes.Transport()
+        sched = scheduler.Scheduler(http=http, rate=20, burst=1)
+
+        for _ in range(3):
+            sched.get('https://api.spotify.com/v1/search')
+
+        self.assertGreaterEqual(http.times[2] - http.times[0], 2 / 20 * 0.9)
+        self.assertEqual(sched.stats()['throttled'], 2)
+
+    @mock.patch.object(scheduler, 'backoff_max', 0.01)
+    def test_server_errors_retried(self):
+        """Test that server errors are retried up to the configured retries."""
+        http = fakes.Transport(*[503] * 5)
+        sched = scheduler.Scheduler(http=http, retries=2)
+
+        self.assertEqual(sched.get('https://api.spotify.com/v1/search').status_code, 503)
+        self.assertEqual(len(http.sent), 3)
+        self.assertEqual(sched.stats()['retried'], 2)
@@ -0,0 +1,78 @@
+"""Test that startup does no avoidable work."""
+
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from apiHandler.util import deps
+
+# milliseconds importing the api handler may take, as reported by -X importtime;
+# loose enough for loaded machines, bench_startup checks the tight budget
+_IMPORT_LIMIT_MS = 100
+
+# modules which must only be loaded on the code paths that need them
+_HEAVY_MODULES = ('requests', 'subprocess', 'concurrent.futures', 'pprint')
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+
+def _importtime(*args):
+    """Run python with -X importtime, return {module: cumulative microseconds}."""
+    out = subprocess.run([sys.executable, '-X', 'importtime', *args], cwd=_ROOT,
+                         capture_output=True, text=True)
+    times = {}
+    for line in out.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+class TestStartup(unittest.TestCase):
+    """Test that startup does no avoidable work."""
+
+    def setUp(self):
+        self._cache = tempfile.TemporaryDirectory()
+        patcher = mock.patch.dict(os.environ, {'XDG_CACHE_HOME': self._cache.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self._cache.cleanup)
+
+    def test_dependency_check_cached(self):
+        """Test that a cached dependency check probes no modules.
+
+        Its time budget is measured by bench_startup.
+        """
+        with mock.patch.object(deps, 'find_spec', wraps=deps.find_spec) as probe:
+            self.assertTrue(deps.check())
+            self.assertGreater(probe.call_count, 0)
+
+            probe.reset_mock()
+            self.assertTrue(deps.check())
+            probe.assert_not_called()
+
+    def test_no_pkg_resources(self):
+        """Test that the dependency check does not import pkg_resources."""
+        code = "import sys; from apiHandler.util import deps; deps.check(); print('pkg_resources' in sys.modules)"
+        out = subprocess.run([sys.executable, '-c', code], cwd=_ROOT, capture_output=True, text=True, check=True)
+        self.assertEqual(out.stdout.strip(), 'False')
+
+    def test_import_budget(self):
+        """Test that importing the api handler is cheap and loads no heavy modules."""
+        times = _importtime('-c', 'import apiHandler.apiHandler')
+        self.assertLess(times['apiHandler.apiHandler'] / 1000, _IMPORT_LIMIT_MS)
+        for module in _HEAVY_MODULES:
+            with self.subTest(module=module):
+                self.assertNotIn(module, times)
+
+    def test_help_imports(self):
+        """Test that --help does not load the api handler at all."""
+        times = _importtime('chillfindr.py', '--help')
+        self.assertNotIn('apiHandler.apiHandler', times)
+        for module in _HEAVY_MODULES:
+            with self.subTest(module=module):
+                self.assertNotIn(module, times)
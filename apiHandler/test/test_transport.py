@@ -0,0 +1,18 @@
+"""Test the pooled HTTP transport."""
+
+import unittest
+from unittest import mock
+
+from apiHandler.util import transport
+
+
+class TestTransport(unittest.TestCase):
+    """Test the pooled HTTP transport."""
+
+    def test_priority_ignored(self):
+        """Test that the transport stands in for a scheduler, dropping the priority."""
+        http = transport.Transport(timeout=5)
+        with mock.patch.object(http._session, 'request') as request:
+            http.get('https://api.spotify.com/v1/search', params={'q': 'lofi'}, priority=10)
+
+        request.assert_called_once_with('GET', 'https://api.spotify.com/v1/search', params={'q': 'lofi'}, timeout=5)
@@ -0,0 +1,58 @@
+"""Test choosing a dialog backend."""
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from apiHandler.util import ui
+
+
+class TestFastest(unittest.TestCase):
+    """Test choosing a dialog backend."""
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self._dir.cleanup)
+        for program in ('zenity', 'rofi'):
+            path = os.path.join(self._dir.name, program)
+            with open(path, 'w') as f:
+                f.write('#!/bin/sh\n')
+            os.chmod(path, 0o755)
+        patcher = mock.patch.dict(os.environ, {'PATH': self._dir.name, 'XDG_CACHE_HOME': self._dir.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_preference_without_measurement(self):
+        """Test that without a measurement the first installed backend is used, without measuring."""
+        with mock.patch.object(ui, 'measure') as measure:
+            self.assertEqual(ui.fastest(), 'zenity')
+        measure.assert_not_called()
+
+    def test_calibrated(self):
+        """Test that calibrated latencies pick the fastest backend, but not for links."""
+        with mock.patch.object(ui, 'measure', side_effect=lambda name: {'zenity': 200.0, 'rofi': 50.0}[name]):
+            ui.calibrate()
+        self.assertEqual(ui.fastest(), 'rofi')
+        self.assertEqual(ui.fastest(links=True), 'zenity')
+
+    def test_calibration_outdated(self):
+        """Test that measurements are ignored once a measured program changed."""
+        with mock.patch.object(ui, 'measure', side_effect=lambda name: {'zenity': 200.0, 'rofi': 50.0}[name]):
+            ui.calibrate()
+        os.utime(os.path.join(self._dir.name, 'rofi'), (0, 0))
+        self.assertEqual(ui.fastest(), 'zenity')
+
+    def test_nothing_installed(self):
+        """Test that the terminal is used if no dialog program is installed."""
+        with mock.patch.dict(os.environ, {'PATH': ''}), mock.patch.object(sys.stdin, 'isatty', return_value=True):
+            self.assertEqual(ui.fastest(), 'terminal')
+
+
+class TestEscape(unittest.TestCase):
+    """Test escaping text for dialog markup."""
+
+    def test_escape(self):
+        """Test that markup characters are escaped."""
+        self.assertEqual(ui.escape("<b>rock & roll</b>"), "&lt;b&gt;rock &amp; roll&lt;/b&gt;")
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+
+## @package cache
+#  Persistent key-value cache with TTL and LRU eviction
+#
+#  Each entry is stored in a file of its own, so a lookup only reads
+#  the entry it needs and processes sharing the cache never overwrite
+#  each other's entries.
+
+import atexit, contextlib, fcntl, hashlib, json, os, time, threading
+# own
+from apiHandler.util import log, paths
+
+## Enable debug logging
+debug = False
+
+## Seconds until a cached entry is stale
+default_ttl = 3600
+
+## Seconds a stale entry may still be served while it is refreshed
+default_grace = 86400
+
+## Maximum number of cached entries
+default_entries = 64
+
+## Cache entry format version, entries of other versions are discarded
+version = 2
+
+
+## @class Cache
+#  Handle a cache directory on disk
+#
+#  Entries are fresh for \a ttl seconds and may be served stale for
+#  another \a grace seconds, so callers can answer immediately and
+#  refresh in the background. When more than \a entries keys are
+#  stored, the least recently used ones are evicted.
+#
+#  An entry file's modification time is the entry's last use.
+#  Hit and miss counters are kept in memory and added to the
+#  stored counters with the next write.
+class Cache:
+
+	## Constructor
+	#  @param name cache name, used as directory name inside the cache directory
+	#  @param ttl seconds until an entry is stale (optional)
+	#  @param grace seconds a stale entry is still served (optional)
+	#  @param entries maximum number of entries (optional)
+	#  @param directory cache directory path [default: cache directory]
+	def __init__(self, name, ttl=None, grace=None, entries=None, directory=None):
+		self._log = log.log(self.__class__.__name__, debug)
+		self._log.dbg("hello from cache %s" %(name))
+
+		self._dir = os.path.join(paths.cache_dir(), name) if directory is None else directory
+		self._ttl = default_ttl if ttl is None else ttl
+		self._grace = default_grace if grace is None else grace
+		self._entries = default_entries if entries is None else entries
+		self._lock = threading.Lock()
+		self._ready = False
+		self._counts = {'hits': 0, 'stale': 0, 'misses': 0}
+		self._dirty = False
+
+
+	## Build a normalized cache key
+	#  @param parts key components, e.g. search term and depth
+	#  @return key string, insensitive to case and whitespace
+	@staticmethod
+	def key(*parts):
+		return '|'.join(' '.join(str(part).lower().split()) for part in parts)
+
+
+	## Create the cache directory on first use
+	#
+	#  Single-file caches of earlier versions are removed.
+	def _prepare(self):
+		if self._ready:
+			return
+		os.makedirs(self._dir, exist_ok=True)
+		if os.path.isfile("%s.json" %(self._dir)):
+			self._log.dbg("removing old cache file %s.json" %(self._dir))
+			os.remove("%s.json" %(self._dir))
+		self._ready = True
+
+	## Get the file of an entry
+	#  @param key cache key
+	#  @return path of the entry's file
+	def _path(self, key):
+		return os.path.join(self._dir, "%s.json" %(hashlib.sha1(key.encode()).hexdigest()))
+
+	## Read a json file
+	#  @param path file path
+	#  @return decoded content, or None if missing or unreadable
+	def _read(self, path):
+		try:
+			with open(path, 'r') as f:
+				return json.load(f)
+		except FileNotFoundError:
+			return None
+		except (OSError, ValueError):
+			self._log.err("discarding unreadable cache file %s" %(path))
+			return None
+
+	## Write a json file atomically, so readers never see partial data
+	#  @param path file path
+	#  @param data json-serializable content
+	def _write(self, path, data):
+		tmp = "%s.%d.tmp" %(path, os.getpid())
+		with open(tmp, 'w') as f:
+			json.dump(data, f)
+		os.replace(tmp, path)
+
+	## Hold the cache's file lock, shared by all processes
+	@contextlib.contextmanager
+	def _exclusive(self):
+		with open(os.path.join(self._dir, 'lock'), 'a') as lock:
+			fcntl.flock(lock, fcntl.LOCK_EX)
+			yield
+
+	## Add this process' counters to the stored ones, the file lock must be held
+	def _save_stats(self):
+		file = os.path.join(self._dir, 'stats')
+		stats = self._read(file) or {}
+		for name, count in self._counts.items():
+			stats[name] = stats.get(name, 0) + count
+		self._write(file, stats)
+		self._counts = dict.fromkeys(self._counts, 0)
+		if self._dirty:
+			self._dirty = False
+			atexit.unregister(self.flush)
+
+	## Count a lookup
+	#  @param name counter name
+	#
+	#  Counters are only written with the next \a put() or on \a flush(),
+	#  which runs at the latest when the process exits.
+	def _count(self, name):
+		self._counts[name] += 1
+		if not self._dirty:
+			self._dirty = True
+			atexit.register(self.flush)
+
+	## Remove the least recently used entries beyond the limit, the file lock must be held
+	def _evict(self):
+		used = {}
+		for name in os.listdir(self._dir):
+			if name.endswith('.json'):
+				try:
+					used[name] = os.stat(os.path.join(self._dir, name)).st_mtime
+				except FileNotFoundError:
+					pass
+		for name in sorted(used, key=used.get)[:max(0, len(used) - self._entries)]:
+			self._log.dbg("evicting: %s" %(name))
+			with contextlib.suppress(FileNotFoundError):
+				os.remove(os.path.join(self._dir, name))
+
+	## Write counters changed by lookups
+	def flush(self):
+		with self._lock:
+			if self._dirty:
+				with self._exclusive():
+					self._save_stats()
+
+
+	## Look up an entry
+	#  @param key cache key as returned by \a key()
+	#  @return tuple of cached value and freshness, or (None, False) on a miss
+	def get(self, key):
+		with self._lock:
+			self._prepare()
+			now = time.time()
+			path = self._path(key)
+			entry = self._read(path)
+			if entry is not None and (entry.get('version') != version or entry.get('key') != key):
+				entry = None
+			age = now - entry['time'] if entry is not None else None
+
+			if entry is None or age > self._ttl + self._grace:
+				self._count('misses')
+				if entry is not None:
+					with contextlib.suppress(FileNotFoundError):
+						os.remove(path)
+				self._log.dbg("miss: %s" %(key))
+				return (None, False)
+
+			fresh = age <= self._ttl
+			self._count('hits' if fresh else 'stale')
+			with contextlib.suppress(FileNotFoundError):
+				os.utime(path, (now, now))
+			self._log.dbg("%s hit: %s" %('fresh' if fresh else 'stale', key))
+			return (entry['value'], fresh)
+
+	## Store an entry
+	#  @param key cache key as returned by \a key()
+	#  @param value json-serializable value
+	def put(self, key, value):
+		with self._lock:
+			self._prepare()
+			now = time.time()
+			path = self._path(key)
+			self._write(path, {'version': version, 'key': key, 'time': now, 'value': value})
+			os.utime(path, (now, now))
+			with self._exclusive():
+				self._evict()
+				self._save_stats()
+
+	## Get cache statistics
+	#  @return dict of hit, stale hit and miss counters and number of entries
+	def stats(self):
+		with self._lock:
+			self._prepare()
+			stats = self._read(os.path.join(self._dir, 'stats')) or {}
+			stats = {name: stats.get(name, 0) + count for name, count in self._counts.items()}
+			stats['entries'] = len([name for name in os.listdir(self._dir) if name.endswith('.json')])
+			return stats
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+## @package deps
+#  Check availability of required modules at startup
+#
+#  Modules are probed with \a importlib.util.find_spec, i.e. without
+#  importing them. A successful check is remembered for the current
+#  interpreter and site-packages state, so later runs skip it entirely.
+
+import json, os, re, sys
+from importlib.util import find_spec
+# own
+from apiHandler.util import paths
+
+## Default requirements file
+requirements = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'test', 'requirements.txt')
+
+
+## Read module names from a requirements file
+#  @param file requirements file path [default: \a requirements]
+#  @return list of module names, without version specifiers
+def names(file=None):
+	file = requirements if file is None else file
+	with open(file, 'r') as f:
+		return [re.match(r"[A-Za-z0-9_.]+", line.strip()).group(0) for line in f if line.strip() and not line.startswith('#')]
+
+
+## Get required modules which cannot be imported
+#  @param file requirements file path [default: \a requirements]
+#  @return list of missing module names
+def missing(file=None):
+	return [name for name in names(file) if find_spec(name) is None]
+
+
+## Describe the current interpreter and its installed packages
+#  @param file requirements file path
+#  @return json-serializable stamp, which changes whenever
+#  the interpreter, a site-packages directory or the requirements change
+def _stamp(file):
+	dirs = [d for d in sys.path if d.endswith(('site-packages', 'dist-packages')) and os.path.isdir(d)]
+	return {
+		'executable': sys.executable,
+		'requirements': [file, os.stat(file).st_mtime],
+		'site': {d: os.stat(d).st_mtime for d in dirs},
+	}
+
+
+## Check that all required modules are available
+#  @param file requirements file path [default: \a requirements]
+#  @return True if all modules are available, else False
+#
+#  Missing modules are reported on stderr.
+def check(file=None):
+	file = requirements if file is None else file
+	stampfile = os.path.join(paths.cache_dir(), 'deps.json')
+	stamp = _stamp(file)
+
+	try:
+		with open(stampfile, 'r') as f:
+			if json.load(f) == stamp:
+				return True
+	except (OSError, ValueError):
+		pass
+
+	absent = missing(file)
+	if len(absent) > 0:
+		print("missing required modules: %s" %(', '.join(absent)), file=sys.stderr)
+		return False
+
+	with open(stampfile, 'w') as f:
+		json.dump(stamp, f)
+	return True
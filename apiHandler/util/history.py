@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+
+## @package history
+#  Remember which playlists the user accepted and rejected
+#
+#  Counts fade with a half-life, so old decisions matter less and
+#  entries which no longer matter are dropped. Recently rejected and
+#  recently played playlists are kept in a set for quick lookup.
+
+import json, os, time, threading
+# own
+from apiHandler.util import log, paths
+
+## Enable debug logging
+debug = False
+
+## Days after which accept and reject counts have faded to half
+half_life = 30
+
+## Days a rejected playlist is held back
+reject_window = 7
+
+## Days an accepted playlist is held back, as it was just played
+played_window = 1
+
+## Maximum number of remembered playlists, least recently decided ones are dropped first
+max_entries = 5000
+
+## Faded count below which an entry is dropped
+min_count = 0.05
+
+## History file format version, files of other versions are discarded
+version = 1
+
+
+## Fade a count
+#  @param count count at \a stamp
+#  @param stamp time of the count
+#  @param now current time
+#  @return count faded by the time passed since \a stamp
+def _fade(count, stamp, now):
+	return count * 0.5 ** ((now - stamp) / (half_life * 86400))
+
+
+## @class History
+#  Handle the selection history file
+#
+#  Each playlist's entry holds its owner, its accept and reject counts
+#  as of the entry's last change, and when it was last accepted and rejected.
+class History:
+
+	## Constructor
+	#  @param file history file path [default: cache directory]
+	def __init__(self, file=None):
+		self._log = log.log(self.__class__.__name__, debug)
+		self._file = os.path.join(paths.cache_dir(), 'history.json') if file is None else file
+		self._lock = threading.Lock()
+		self._entries = None
+		self._owners = None
+		self._held = None
+
+
+	## Load history file on first use
+	#
+	#  Builds the set of held back playlists and the owners' accept counts.
+	def _load(self):
+		if self._entries is not None:
+			return
+		data = {}
+		if os.path.isfile(self._file):
+			try:
+				with open(self._file, 'r') as f:
+					data = json.load(f)
+			except (OSError, ValueError):
+				self._log.err("discarding unreadable history file %s" %(self._file))
+		self._entries = data.get('entries', {}) if data.get('version') == version else {}
+
+		now = time.time()
+		self._held = set(pid for pid, entry in self._entries.items() if self._holds(entry, now))
+		self._owners = {}
+		for entry in self._entries.values():
+			if entry['owner'] != '':
+				self._owners[entry['owner']] = self._owners.get(entry['owner'], 0) + _fade(entry['accepted'], entry['time'], now)
+
+	## Store history to file
+	#
+	#  Faded entries are dropped, and the oldest ones beyond \a max_entries.
+	def _save(self):
+		now = time.time()
+		keep = [pid for pid, entry in self._entries.items()
+			if self._holds(entry, now) or _fade(entry['accepted'] + entry['rejected'], entry['time'], now) >= min_count]
+		keep = sorted(keep, key=lambda pid: self._entries[pid]['time'], reverse=True)[:max_entries]
+		self._entries = {pid: self._entries[pid] for pid in keep}
+		self._held = set(pid for pid in keep if self._holds(self._entries[pid], now))
+
+		tmp = "%s.%d.tmp" %(self._file, os.getpid())
+		with open(tmp, 'w') as f:
+			json.dump({'version': version, 'entries': self._entries}, f)
+		os.replace(tmp, self._file)
+
+	## Check if an entry's playlist is held back
+	#  @param entry history entry
+	#  @param now current time
+	#  @return True if it was rejected or played recently
+	def _holds(self, entry, now):
+		return now - entry['rejected_at'] < reject_window * 86400 or now - entry['accepted_at'] < played_window * 86400
+
+	## Count a decision
+	#  @param pl \a Playlist record
+	#  @param field 'accepted' or 'rejected'
+	#  @param now current time
+	def _count(self, pl, field, now):
+		entry = self._entries.get(pl.id) or {'owner': pl.owner, 'accepted': 0, 'rejected': 0, 'time': now, 'accepted_at': 0, 'rejected_at': 0}
+		entry['accepted'] = _fade(entry['accepted'], entry['time'], now)
+		entry['rejected'] = _fade(entry['rejected'], entry['time'], now)
+		entry[field] += 1
+		entry[field + '_at'] = now
+		entry['time'] = now
+		self._entries[pl.id] = entry
+		self._held.add(pl.id)
+
+
+	## Check if a playlist is held back, the lock must be held
+	#  @param pl \a Playlist record
+	#  @param now current time
+	#
+	#  Holds which expired since they were added are released.
+	def _is_held(self, pl, now):
+		if pl.id not in self._held:
+			return False
+		if self._holds(self._entries[pl.id], now):
+			return True
+		self._held.discard(pl.id)
+		return False
+
+	## Get a playlist's faded acceptances, the lock must be held
+	#  @param pl \a Playlist record
+	#  @param now current time
+	def _times(self, pl, now):
+		entry = self._entries.get(pl.id)
+		own = _fade(entry['accepted'], entry['time'], now) if entry is not None else 0
+		owner = self._owners.get(pl.owner, own) if pl.owner != '' else own
+		return own + max(0, owner - own) / 2
+
+	## Get a playlist's faded rejections, the lock must be held
+	#  @param pl \a Playlist record
+	#  @param now current time
+	def _rejections(self, pl, now):
+		entry = self._entries.get(pl.id)
+		return _fade(entry['rejected'], entry['time'], now) if entry is not None else 0
+
+
+	## Check if a playlist was rejected or played recently
+	#  @param pl \a Playlist record
+	#  @return True if the playlist should not be suggested now
+	def held(self, pl):
+		with self._lock:
+			self._load()
+			return self._is_held(pl, time.time())
+
+	## Get how often a playlist was accepted
+	#  @param pl \a Playlist record
+	#  @return faded acceptances of the playlist, plus half the other faded acceptances of its owner
+	def times(self, pl):
+		with self._lock:
+			self._load()
+			return self._times(pl, time.time())
+
+	## Get how often a playlist was rejected
+	#  @param pl \a Playlist record
+	#  @return faded rejections of the playlist
+	def rejections(self, pl):
+		with self._lock:
+			self._load()
+			return self._rejections(pl, time.time())
+
+	## Look up several playlists at once
+	#  @param playlists list of \a Playlist records
+	#  @return list of tuples (held, times, rejections), one per playlist,
+	#  as returned by \a held(), \a times() and \a rejections()
+	def lookup(self, playlists):
+		with self._lock:
+			self._load()
+			now = time.time()
+			return [(self._is_held(pl, now), self._times(pl, now), self._rejections(pl, now)) for pl in playlists]
+
+	## Remember a playlist as accepted
+	#  @param pl \a Playlist record
+	def accept(self, pl):
+		with self._lock:
+			self._load()
+			self._count(pl, 'accepted', time.time())
+			if pl.owner != '':
+				self._owners[pl.owner] = self._owners.get(pl.owner, 0) + 1
+			self._save()
+			self._log.dbg("accepted %s" %(pl.id))
+
+	## Remember playlists as rejected
+	#  @param playlists list of \a Playlist records
+	def reject(self, playlists):
+		with self._lock:
+			self._load()
+			now = time.time()
+			for pl in playlists:
+				self._count(pl, 'rejected', now)
+			self._save()
+			self._log.dbg("rejected %d playlists" %(len(playlists)))
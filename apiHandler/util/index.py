@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+
+## @package index
+#  Local inverted index of known playlists
+#
+#  Every playlist found is stored with its name, description,
+#  owner and track count, and when it was last found. Queries are
+#  answered from disk, matching whole words, word prefixes and words
+#  with a typo. Playlists are added in the background, so searching
+#  spotify never waits for the index file to be rewritten.
+
+import bisect, fcntl, json, os, re, threading, time
+# own
+from apiHandler.util import log, paths
+from apiHandler.playlist import Playlist
+
+## Enable debug logging
+debug = False
+
+## Index file format version, files of other versions are discarded
+version = 3
+
+## Maximum number of indexed playlists, least recently found ones are dropped first
+max_docs = 10000
+
+## Days after which a playlist which was not found again is dropped
+max_age = 90
+
+## Minimum word length for typo-tolerant matching
+fuzzy_length = 4
+
+## Score of a query word matching a playlist word exactly, by prefix or with a typo
+scores = {'exact': 3, 'prefix': 2, 'fuzzy': 1}
+
+
+## Split text into lowercase words
+#  @param text any string
+#  @return list of words
+def tokens(text):
+	return re.findall(r"\w+", text.lower())
+
+
+## Check if two words differ by at most one edit
+#  @param a word
+#  @param b word
+#  @return True if \a b can be made from \a a by one insertion,
+#  deletion, substitution or swap of neighbouring letters
+def _one_edit(a, b):
+	if abs(len(a) - len(b)) > 1:
+		return False
+	if len(a) > len(b):
+		a, b = b, a
+	i = 0
+	while i < len(a) and a[i] == b[i]:
+		i += 1
+	if len(a) == len(b):
+		swapped = i + 1 < len(a) and a[i] == b[i+1] and a[i+1] == b[i]
+		return a[i+1:] == b[i+1:] or (swapped and a[i+2:] == b[i+2:])
+	return a[i:] == b[i+1:]
+
+
+## @class Index
+#  Handle the playlist index file
+class Index:
+
+	## Constructor
+	#  @param file index file path [default: cache directory]
+	def __init__(self, file=None):
+		self._log = log.log(self.__class__.__name__, debug)
+		self._log.dbg("hello from index")
+
+		self._file = os.path.join(paths.cache_dir(), 'index.json') if file is None else file
+		self._lock = threading.Lock()
+		self._docs = None
+		self._postings = None
+		self._words = None
+		self._pending = []
+		self._writer = None
+
+
+	## Read the index file
+	#  @return tuple of dicts of playlist id to row and to the time it was last found
+	def _read(self):
+		data = {}
+		if os.path.isfile(self._file):
+			try:
+				with open(self._file, 'r') as f:
+					data = json.load(f)
+			except (OSError, ValueError):
+				self._log.err("discarding unreadable index file %s" %(self._file))
+		if data.get('version') != version:
+			return {}, {}
+		return data['docs'], data['seen']
+
+	## Build the postings of the loaded playlists
+	def _build(self):
+		self._postings = {}
+		for pid, row in self._docs.items():
+			for word in self._words_of(Playlist.from_row(row)):
+				self._postings.setdefault(word, set()).add(pid)
+		self._words = sorted(self._postings)
+
+	## Load index file on first search
+	def _load(self):
+		if self._docs is not None:
+			return
+		self._docs, _ = self._read()
+		self._build()
+
+
+	## Get the words a playlist is found by
+	#  @param pl \a Playlist
+	#  @return set of words
+	def _words_of(self, pl):
+		return set(tokens("%s %s %s" %(pl.name, pl.description, pl.owner)))
+
+
+	## Merge playlists into the index file
+	#  @param playlists list of \a Playlist records
+	#
+	#  The file is re-read under an exclusive lock, so playlists other
+	#  processes added meanwhile are kept. Playlists not found for
+	#  \a max_age days are dropped, and the least recently found ones
+	#  beyond \a max_docs.
+	def _merge(self, playlists):
+		with open("%s.lock" %(self._file), 'a') as lock:
+			fcntl.flock(lock, fcntl.LOCK_EX)
+			docs, seen = self._read()
+			now = time.time()
+			for pl in playlists:
+				docs[pl.id] = pl.to_row()
+				seen[pl.id] = now
+
+			keep = [pid for pid in docs if now - seen.get(pid, 0) < max_age * 86400]
+			keep = sorted(keep, key=lambda pid: seen[pid], reverse=True)[:max_docs]
+			docs = {pid: docs[pid] for pid in keep}
+			seen = {pid: seen[pid] for pid in keep}
+
+			tmp = "%s.%d.tmp" %(self._file, os.getpid())
+			with open(tmp, 'w') as f:
+				json.dump({'version': version, 'docs': docs, 'seen': seen}, f)
+			os.replace(tmp, self._file)
+
+		with self._lock:
+			if self._docs is not None:
+				self._docs = docs
+				self._build()
+		self._log.dbg("index holds %d playlists" %(len(docs)))
+
+	## Write added playlists until none are left
+	def _write_pending(self):
+		while True:
+			with self._lock:
+				playlists, self._pending = self._pending, []
+				if len(playlists) == 0:
+					self._writer = None
+					return
+			try:
+				self._merge(playlists)
+			except OSError as e:
+				self._log.err("could not update index file %s: %s" %(self._file, e))
+
+
+	## Add playlists to the index
+	#  @param playlists list of \a Playlist records
+	#
+	#  Known playlists are updated. The index file is written by a
+	#  background thread, which the process waits for before exiting.
+	def add(self, playlists):
+		with self._lock:
+			self._pending.extend(playlists)
+			if self._writer is None:
+				self._writer = threading.Thread(target=self._write_pending)
+				self._writer.start()
+
+	## Wait until all added playlists are written
+	def flush(self):
+		while True:
+			with self._lock:
+				writer = self._writer
+			if writer is None:
+				return
+			writer.join()
+
+
+	## Find the playlists matching one query word
+	#  @param term query word
+	#  @return dict of playlist id to score
+	def _match(self, term):
+		found = {}
+		start = bisect.bisect_left(self._words, term)
+		for word in self._words[start:]:
+			if not word.startswith(term):
+				break
+			score = scores['exact'] if word == term else scores['prefix']
+			for pid in self._postings[word]:
+				found[pid] = max(found.get(pid, 0), score)
+
+		if len(found) == 0 and len(term) >= fuzzy_length:
+			for word in self._words:
+				if _one_edit(term, word):
+					for pid in self._postings[word]:
+						found[pid] = scores['fuzzy']
+		return found
+
+	## Search the index
+	#  @param query search term
+	#  @return list of matching \a Playlist records, best matches first
+	#
+	#  A playlist matches if it matches every word of the query.
+	def search(self, query):
+		with self._lock:
+			self._load()
+			total = None
+			for term in tokens(query):
+				found = self._match(term)
+				if total is None:
+					total = found
+				else:
+					total = {pid: score + found[pid] for pid, score in total.items() if pid in found}
+
+			ranked = sorted((total or {}).items(), key=lambda item: item[1], reverse=True)
+			self._log.dbg("%d indexed playlists match %s" %(len(ranked), query))
+			return [Playlist.from_row(self._docs[pid]) for pid, _ in ranked]
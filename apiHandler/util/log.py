@@ -3,7 +3,17 @@
 ## @package log
 #  Simple logging, specialized for debug logging
 
-import sys, pprint
+import sys
+
+## Stream regular and debug messages are written to, None for stdout
+#
+#  Set to sys.stderr when stdout carries the program's output, e.g. to be read by another program.
+stream = None
+
+## Get the stream regular and debug messages are written to
+#  @return \a stream, or the current stdout if not set
+def _out():
+	return sys.stdout if stream is None else stream
 
 ## @class log.log
 #  Provide simple logging functionality
@@ -16,21 +26,21 @@ class log:
 		self.debug = debug
 		self.name = name
 
-	## Log a given message to stdout
+	## Log a given message to \a stream
 	def log(self, *args, **kwargs):
-		print("%s:" %(self.name), end=' ')
-		print(*args, **kwargs)
+		print("%s:" %(self.name), file=_out(), end=' ')
+		print(*args, file=_out(), **kwargs)
 
 	## Log a given message to stderr
 	def err(self, *args, **kwargs):
-		print("%s:" %(self.name), end=' ')
+		print("%s:" %(self.name), file=sys.stderr, end=' ')
 		print(*args, file=sys.stderr, **kwargs)
 
-	## Log a given message if debug enabled
+	## Log a given message to \a stream if debug enabled
 	def dbg(self, *args, **kwargs):
 		if self.debug:
-			print("%s:" %(self.name), end=' ')
-			print(*args, **kwargs)
+			print("%s:" %(self.name), file=_out(), end=' ')
+			print(*args, file=_out(), **kwargs)
 
 	## Log a given message to stderr if debug enabled
 	def dbgerr(self, *args, **kwargs):
@@ -41,5 +51,6 @@ class log:
 	## Pretty print a json object if debug enabled
 	def dbg_json(self, *args, **kwargs):
 		if self.debug:
-			print("%s:" %(self.name), end=' ')
-			pprint.pprint(*args, **kwargs)
\ No newline at end of file
+			import pprint
+			print("%s:" %(self.name), file=_out(), end=' ')
+			pprint.pprint(*args, stream=_out(), **kwargs)
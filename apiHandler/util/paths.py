@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+
+## @package paths
+#  Locations of files written at runtime
+
+import os, tempfile
+
+## Get the directory for cached data
+#  @return path to the cache directory, created if missing
+#
+#  Follows the XDG base directory spec, i.e. ~/.cache/chillfindr by default.
+def cache_dir():
+	base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+	path = os.path.join(base, 'chillfindr')
+	os.makedirs(path, exist_ok=True)
+	return path
+
+## Get the path of the daemon's unix socket
+#  @return socket path inside the user's runtime directory
+def socket_file():
+	base = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+	return os.path.join(base, 'chillfindr-%d.sock' %(os.getuid()))
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+
+## @package pipeline
+#  Request pipeline with pluggable middleware
+#
+#  A middleware is a callable taking a \a Request and the next
+#  stage of the pipeline, i.e. a callable sending a \a Request and
+#  returning its response. Middleware may modify the request,
+#  short-circuit, or send it several times.
+
+import threading, time
+# own
+from apiHandler.util import log
+
+## Enable debug logging
+debug = False
+
+## Retries of requests which failed to reach the server
+default_retries = 2
+
+## Consecutive failures which open the circuit breaker
+default_threshold = 5
+
+## Seconds an open circuit breaker rejects requests
+default_cooldown = 30
+
+
+## @class Request
+#  Outgoing request passed along the pipeline
+class Request:
+
+	## Constructor
+	#  @param method HTTP method
+	#  @param url request url
+	#  @param kwargs keyword arguments for the transport
+	def __init__(self, method, url, **kwargs):
+		self.method = method
+		self.url = url
+		self.kwargs = kwargs
+		self.kwargs['headers'] = dict(kwargs.get('headers') or {})
+
+
+## @class ErrorResponse
+#  Stand-in response for requests that did not get an answer
+class ErrorResponse:
+
+	## Constructor
+	#  @param status_code HTTP status code to report
+	#  @param reason error description
+	def __init__(self, status_code, reason):
+		self.status_code = status_code
+		self.reason = reason
+		self.headers = {}
+		self.content = b''
+
+	def __repr__(self):
+		return "<ErrorResponse [%d] %s>" %(self.status_code, self.reason)
+
+	## Decode response, in the format of spotify's errors
+	def json(self):
+		return {'error': {'status': self.status_code, 'message': self.reason}}
+
+
+## @class Pipeline
+#  Send requests through a chain of middleware
+class Pipeline:
+
+	## Constructor
+	#  @param http transport sending the final request
+	#  @param middleware list of middleware, outermost first
+	def __init__(self, http, middleware):
+		self._log = log.log(self.__class__.__name__, debug)
+		self._http = http
+		self._send = lambda request: self._http.request(request.method, request.url, **request.kwargs)
+		for mw in reversed(middleware):
+			self._send = (lambda mw, send: lambda request: mw(request, send))(mw, self._send)
+
+	## Send a request through the pipeline
+	#  @param method HTTP method
+	#  @param url request url
+	#  @return response
+	def request(self, method, url, **kwargs):
+		return self._send(Request(method, url, **kwargs))
+
+
+## @class Timeout
+#  Set a default timeout on every request
+class Timeout:
+
+	## Constructor
+	#  @param timeout seconds, or (connect, read) tuple
+	def __init__(self, timeout):
+		self._timeout = timeout
+
+	def __call__(self, request, send):
+		request.kwargs.setdefault('timeout', self._timeout)
+		return send(request)
+
+
+## @class Retry
+#  Retry requests which failed to reach the server
+#
+#  Connection errors and timeouts are retried, if all attempts
+#  fail, a 503 \a ErrorResponse is returned instead of raising.
+class Retry:
+
+	## Constructor
+	#  @param retries number of retries (optional)
+	def __init__(self, retries=None):
+		self._log = log.log(self.__class__.__name__, debug)
+		self._retries = default_retries if retries is None else retries
+
+	def __call__(self, request, send):
+		for attempt in range(self._retries + 1):
+			try:
+				return send(request)
+			except OSError as e:
+				# requests' exceptions derive from IOError
+				self._log.dbg("attempt %d failed: %s" %(attempt + 1, e))
+				error = e
+		return ErrorResponse(503, str(error))
+
+
+## @class CircuitBreaker
+#  Stop sending requests while the server keeps failing
+#
+#  After \a threshold consecutive server errors, requests are rejected
+#  with a 503 \a ErrorResponse for \a cooldown seconds. Afterwards a
+#  single request is let through to probe whether the server recovered.
+class CircuitBreaker:
+
+	## Constructor
+	#  @param threshold consecutive failures to open the breaker (optional)
+	#  @param cooldown seconds the breaker stays open (optional)
+	def __init__(self, threshold=None, cooldown=None):
+		self._log = log.log(self.__class__.__name__, debug)
+		self._threshold = default_threshold if threshold is None else threshold
+		self._cooldown = default_cooldown if cooldown is None else cooldown
+		self._lock = threading.Lock()
+		self._failures = 0
+		self._open_until = 0
+
+	def __call__(self, request, send):
+		with self._lock:
+			now = time.monotonic()
+			if self._failures >= self._threshold:
+				if now < self._open_until:
+					return ErrorResponse(503, "circuit open, not sending request")
+				# half open: let this request probe, hold back the others
+				self._open_until = now + self._cooldown
+
+		response = send(request)
+
+		with self._lock:
+			if response.status_code >= 500:
+				self._failures += 1
+				if self._failures >= self._threshold:
+					self._log.err("spotify keeps failing, pausing requests for %ds" %(self._cooldown))
+					self._open_until = time.monotonic() + self._cooldown
+			else:
+				self._failures = 0
+		return response
+
+
+## @class Authorization
+#  Add the user's access token, refresh it once on 401
+#
+#  When several requests fail with the same expired token,
+#  \a authorize.Auth.refresh() only refreshes it once.
+#  If the token cannot be fetched because the accounts service is
+#  unreachable, a 503 \a ErrorResponse is returned instead of raising.
+class Authorization:
+
+	## Constructor
+	#  @param auth \a authorize.Auth instance
+	#  @param user callable returning the current user id
+	def __init__(self, auth, user):
+		self._log = log.log(self.__class__.__name__, debug)
+		self._auth = auth
+		self._user = user
+
+	## Send request with the user's current token
+	#  @return tuple of response and the token used
+	def _send(self, request, send):
+		try:
+			token = self._auth.access_token(self._user())
+		except OSError as e:
+			# requests' exceptions derive from IOError
+			self._log.dbg("could not get access token: %s" %(e))
+			return ErrorResponse(503, str(e)), None
+		request.kwargs['headers']['Authorization'] = f"Bearer {token}"
+		return send(request), token
+
+	def __call__(self, request, send):
+		response, token = self._send(request, send)
+		if response.status_code != 401:
+			return response
+
+		user = self._user()
+		try:
+			refreshed = self._auth.refresh(user, token)
+		except OSError as e:
+			self._log.dbg("could not refresh access token: %s" %(e))
+			return ErrorResponse(503, str(e))
+		if not refreshed:
+			self._log.err("Could not refresh access token for user %s" %(user))
+			return response
+
+		response, _ = self._send(request, send)
+		return response
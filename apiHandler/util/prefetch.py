@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+## @package prefetch
+#  Run speculative work in the background
+#
+#  Jobs are run on a small thread pool and can be cancelled as a
+#  whole, e.g. when the user aborts. Queued jobs are dropped, running
+#  jobs are asked to stop through the callable passed to them.
+
+import threading
+# own
+from apiHandler.util import log
+
+## Enable debug logging
+debug = False
+
+## Default number of worker threads
+default_workers = 2
+
+
+## @class Prefetcher
+#  Background jobs which may be cancelled
+class Prefetcher:
+
+	## Constructor
+	#  @param workers number of worker threads (optional)
+	def __init__(self, workers=None):
+		self._log = log.log(self.__class__.__name__, debug)
+		self._workers = default_workers if workers is None else workers
+		self._lock = threading.Lock()
+		self._pool = None
+		self._jobs = {}
+		self._closed = False
+
+	## Start a job, unless one with the same key was started before
+	#  @param key job identifier
+	#  @param fn callable, called with the job's arguments and a \a stop keyword
+	#  argument: a callable returning True once the job should give up
+	#  @param args arguments for \a fn
+	#  @return concurrent.futures.Future of the job, or None if cancelled
+	def submit(self, key, fn, *args):
+		with self._lock:
+			if self._closed:
+				return None
+			if key in self._jobs:
+				return self._jobs[key][0]
+			if self._pool is None:
+				from concurrent.futures import ThreadPoolExecutor
+				self._pool = ThreadPoolExecutor(max_workers=self._workers)
+
+			stop = threading.Event()
+			future = self._pool.submit(fn, *args, stop=stop.is_set)
+			self._jobs[key] = (future, stop)
+			self._log.dbg("prefetching %s" %(key,))
+			return future
+
+	## Cancel all jobs
+	#  @param keep keys of jobs which may finish (optional)
+	#
+	#  No new jobs are started afterwards.
+	def cancel(self, keep=()):
+		with self._lock:
+			self._closed = True
+			for key, (future, stop) in self._jobs.items():
+				if key in keep:
+					continue
+				if not future.cancel():
+					stop.set()
+			if self._pool is not None:
+				self._pool.shutdown(wait=False)
+			self._log.dbg("cancelled prefetching, keeping %s" %(list(keep)))
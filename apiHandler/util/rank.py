@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+## @package rank
+#  Rank playlists by relevance before suggesting them
+#
+#  A playlist's score combines how well its name and description match
+#  the keywords which found it, its track count, its owner and how often
+#  the user accepted it or its owner before. Rejections lower it.
+#  Playlists are suggested in random order weighted by score.
+
+import math, random
+# own
+from apiHandler.util.index import tokens
+
+## Weight of each feature in a playlist's score
+weights = {'name': 3.0, 'description': 1.0, 'tracks': 1.0, 'owner': 0.5, 'accepted': 2.0}
+
+## Score every playlist has, so that any of them may be suggested
+base = 0.1
+
+## Track count which scores full points, fewer tracks score logarithmically less
+full_tracks = 200
+
+## Owners whose playlists are curated
+curators = ('spotify',)
+
+## Factor a playlist's score is multiplied with per rejection
+rejected = 0.5
+
+
+## Check if a keyword matches a text
+#  @param keyword search keyword
+#  @param words set of the text's words
+#  @return fraction of the keyword's words contained in the text
+def _match(keyword, words):
+	terms = tokens(keyword)
+	if len(terms) == 0:
+		return 0.0
+	return sum(term in words for term in terms) / len(terms)
+
+
+## Get a playlist's features
+#  @param pl \a Playlist record
+#  @param times how often the playlist was accepted, see \a history.History.times()
+#  @return list of feature values between 0 and 1, in order of \a weights
+def features(pl, times=0):
+	name = set(tokens(pl.name))
+	description = set(tokens(pl.description))
+	keywords = pl.keywords or []
+	count = max(1, len(keywords))
+
+	return [
+		sum(_match(word, name) for word in keywords) / count,
+		sum(_match(word, description) for word in keywords) / count,
+		min(1.0, math.log1p(pl.total) / math.log1p(full_tracks)),
+		1.0 if pl.owner.lower() in curators else 0.0,
+		1 - 0.5 ** times,
+	]
+
+
+## Look up playlists in the history
+#  @param playlists list of \a Playlist records
+#  @param history \a history.History of the user, or None
+#  @return list of tuples (held, times, rejections), see \a history.History.lookup()
+def _lookup(playlists, history):
+	if history is None:
+		return [(False, 0, 0)] * len(playlists)
+	return history.lookup(playlists)
+
+
+## Score playlists by their features and history
+#  @param playlists list of \a Playlist records
+#  @param looked tuples returned by \a _lookup(), one per playlist
+#  @return list of scores
+def _weigh(playlists, looked):
+	factors = list(weights.values())
+	return [(sum(f * w for f, w in zip(features(pl, times), factors)) + base) * rejected ** rejections
+		for pl, (_, times, rejections) in zip(playlists, looked)]
+
+
+## Score playlists
+#  @param playlists list of \a Playlist records
+#  @param history \a history.History of the user (optional)
+#  @return list of scores, higher is more relevant
+def scores(playlists, history=None):
+	return _weigh(playlists, _lookup(playlists, history))
+
+
+## Sample playlists weighted by score
+#  @param playlists list of \a Playlist records
+#  @param looked tuples returned by \a _lookup(), one per playlist
+#  @return the playlists in random order, higher scores tending to come first
+def _sample(playlists, looked):
+	keys = [random.random() ** (1 / w) for w in _weigh(playlists, looked)]
+	return [pl for _, pl in sorted(zip(keys, playlists), key=lambda item: item[0], reverse=True)]
+
+
+## Order playlists for suggestion
+#  @param playlists list of \a Playlist records
+#  @param history \a history.History of the user (optional)
+#  @return the same playlists in random order, more relevant ones tending to come first
+#
+#  This is weighted sampling without replacement: each playlist gets the
+#  key u^(1/score) for a uniform random u, and keys are sorted descending.
+#  Playlists the history holds back come last, scored without their history.
+#  The history is looked up once for all playlists.
+def order(playlists, history=None):
+	looked = _lookup(playlists, history)
+	fresh = [i for i, (held, _, _) in enumerate(looked) if not held]
+	held = [i for i, (held, _, _) in enumerate(looked) if held]
+	return (_sample([playlists[i] for i in fresh], [looked[i] for i in fresh])
+		+ _sample([playlists[i] for i in held], [(True, 0, 0)] * len(held)))
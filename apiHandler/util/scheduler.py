@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+
+## @package scheduler
+#  Rate-limit-aware scheduling of outgoing API requests
+#
+#  All requests pass a client-side token bucket in priority order.
+#  Spotify's 429 responses pause all requests for the time given
+#  in their Retry-After header, server errors are retried with
+#  jittered exponential backoff.
+
+import heapq, itertools, random, threading, time
+# own
+from apiHandler.util import log, transport
+
+## Enable debug logging
+debug = False
+
+## Priority of requests the user is waiting for
+INTERACTIVE = 0
+
+## Priority of speculative requests, e.g. prefetching
+PREFETCH = 10
+
+## Sustained requests per second
+default_rate = 10.0
+
+## Requests which may be sent at once after being idle
+default_burst = 10
+
+## Retries of rate-limited or failed requests
+default_retries = 3
+
+## Base delay in seconds for retrying server errors
+backoff_base = 0.5
+
+## Maximum delay in seconds for retrying server errors
+backoff_max = 8.0
+
+## Longest Retry-After in seconds that is waited for instead of giving up
+max_retry_after = 30
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+## Get the scheduler shared by all API clients
+#  @return shared \a Scheduler instance on the shared transport
+def shared():
+	global _shared
+	with _shared_lock:
+		if _shared is None:
+			_shared = Scheduler()
+	return _shared
+
+
+## @class Scheduler
+#  Send requests through a token bucket, in priority order
+#
+#  Offers the same request methods as \a transport.Transport,
+#  with an additional \a priority keyword argument.
+class Scheduler:
+
+	## Constructor
+	#  @param http transport [default: shared transport]
+	#  @param rate sustained requests per second (optional)
+	#  @param burst bucket size (optional)
+	#  @param retries retries per request (optional)
+	def __init__(self, http=None, rate=None, burst=None, retries=None):
+		self._log = log.log(self.__class__.__name__, debug)
+		self._log.dbg("hello from scheduler")
+
+		self._http = transport.shared() if http is None else http
+		self._rate = default_rate if rate is None else rate
+		self._burst = default_burst if burst is None else burst
+		self._retries = default_retries if retries is None else retries
+
+		self._cond = threading.Condition()
+		self._queue = []
+		self._seq = itertools.count()
+		self._tokens = self._burst
+		self._stamp = time.monotonic()
+		self._paused_until = 0
+		self._stats = {'requests': 0, 'throttled': 0, 'rate_limited': 0, 'retried': 0}
+
+
+	## Refill the token bucket
+	#  @param now current monotonic time
+	def _refill(self, now):
+		self._tokens = min(self._burst, self._tokens + (now - self._stamp) * self._rate)
+		self._stamp = now
+
+	## Wait until a request of the given priority may be sent
+	#  @param priority request priority, lower is more urgent
+	def _acquire(self, priority):
+		with self._cond:
+			ticket = (priority, next(self._seq))
+			heapq.heappush(self._queue, ticket)
+			throttled = False
+
+			while True:
+				wait = None
+				if self._queue[0] == ticket:
+					now = time.monotonic()
+					self._refill(now)
+					wait = self._paused_until - now
+					if wait <= 0:
+						if self._tokens >= 1:
+							break
+						wait = (1 - self._tokens) / self._rate
+				throttled = True
+				self._cond.wait(wait)
+
+			self._tokens -= 1
+			heapq.heappop(self._queue)
+			self._stats['requests'] += 1
+			if throttled:
+				self._stats['throttled'] += 1
+			self._cond.notify_all()
+
+	## Pause all requests
+	#  @param seconds time to pause for
+	def _pause(self, seconds):
+		with self._cond:
+			self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+			self._stats['rate_limited'] += 1
+			self._cond.notify_all()
+
+
+	## Send a request once it is its turn, retrying if required
+	#  @param method HTTP method
+	#  @param url request url
+	#  @param priority request priority [default: \a INTERACTIVE]
+	#  @return requests.Response of the last attempt
+	def request(self, method, url, priority=INTERACTIVE, **kwargs):
+		attempt = 0
+		while True:
+			self._acquire(priority)
+			response = self._http.request(method, url, **kwargs)
+
+			delay = 0
+			if response.status_code == 429:
+				retry_after = float(response.headers.get('Retry-After', 1))
+				self._log.dbg("rate limited for %.1fs" %(retry_after))
+				if retry_after > max_retry_after:
+					return response
+				self._pause(retry_after)
+			elif response.status_code >= 500:
+				delay = random.uniform(0, min(backoff_max, backoff_base * 2 ** attempt))
+				self._log.dbg("server error %d, retrying in %.1fs" %(response.status_code, delay))
+			else:
+				return response
+
+			if attempt >= self._retries:
+				return response
+			attempt += 1
+			with self._cond:
+				self._stats['retried'] += 1
+			time.sleep(delay)
+
+	## Send a GET request
+	def get(self, url, **kwargs):
+		return self.request('GET', url, **kwargs)
+
+	## Send a POST request
+	def post(self, url, **kwargs):
+		return self.request('POST', url, **kwargs)
+
+	## Send a PUT request
+	def put(self, url, **kwargs):
+		return self.request('PUT', url, **kwargs)
+
+	## Get request counters
+	#  @return dict of sent, throttled, rate-limited and retried requests
+	def stats(self):
+		with self._cond:
+			return dict(self._stats)
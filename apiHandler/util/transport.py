@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+## @package transport
+#  Shared HTTP transport with keep-alive connection pooling
+#
+#  All traffic to api.spotify.com and accounts.spotify.com goes
+#  through one \a Transport, so consecutive requests reuse warm connections.
+
+import threading
+# own
+from apiHandler.util import log
+
+## Enable debug logging
+debug = False
+
+## Number of per-host connection pools to keep
+pool_connections = 4
+
+## Default number of kept-alive connections per host
+pool_maxsize = 4
+
+## Per-host connection limits, overriding \a pool_maxsize
+host_limits = {
+	'https://api.spotify.com/': 10,
+	'https://accounts.spotify.com/': 2,
+}
+
+## Default (connect, read) timeout in seconds
+default_timeout = (3.05, 10)
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+## Get the transport shared by all API clients
+#  @return shared \a Transport instance, created on first use
+def shared():
+	global _shared
+	with _shared_lock:
+		if _shared is None:
+			_shared = Transport()
+	return _shared
+
+
+## @class Transport
+#  Pooled HTTP session
+#
+#  Wraps a \a requests.Session with one connection pool per host.
+#  Hosts listed in \a host_limits block instead of opening
+#  more than their configured number of connections.
+class Transport:
+
+	## Constructor
+	#  @param connections number of per-host connection pools (optional)
+	#  @param maxsize default connections per host (optional)
+	#  @param limits dict of url prefix to connection limit (optional)
+	#  @param timeout default (connect, read) timeout in seconds (optional)
+	def __init__(self, connections=None, maxsize=None, limits=None, timeout=None):
+		self._log = log.log(self.__class__.__name__, debug)
+		self._log.dbg("hello from transport")
+
+		self.timeout = default_timeout if timeout is None else timeout
+		connections = pool_connections if connections is None else connections
+		maxsize = pool_maxsize if maxsize is None else maxsize
+		limits = host_limits if limits is None else limits
+
+		# requests is slow to import, only load it once a transport is needed
+		import requests
+		from requests.adapters import HTTPAdapter
+
+		self._session = requests.Session()
+		self._session.mount('https://', HTTPAdapter(pool_connections=connections, pool_maxsize=maxsize))
+		for prefix, limit in limits.items():
+			self._log.dbg("limiting %s to %d connections" %(prefix, limit))
+			self._session.mount(prefix, HTTPAdapter(pool_connections=1, pool_maxsize=limit, pool_block=True))
+
+
+	## Send a request over the pooled session
+	#  @param method HTTP method
+	#  @param url request url
+	#  @param priority ignored, requests are sent right away
+	#  @return requests.Response
+	#
+	#  Accepts the same keyword arguments as \a requests.request,
+	#  \a timeout defaults to the transport's timeout.
+	#  \a priority is accepted so the transport can stand in for a \a scheduler.Scheduler.
+	def request(self, method, url, priority=None, **kwargs):
+		kwargs.setdefault('timeout', self.timeout)
+		self._log.dbg("%s %s" %(method, url))
+		return self._session.request(method, url, **kwargs)
+
+	## Send a GET request
+	def get(self, url, **kwargs):
+		return self.request('GET', url, **kwargs)
+
+	## Send a POST request
+	def post(self, url, **kwargs):
+		return self.request('POST', url, **kwargs)
+
+	## Send a PUT request
+	def put(self, url, **kwargs):
+		return self.request('PUT', url, **kwargs)
+
+	## Close all pooled connections
+	def close(self):
+		self._session.close()
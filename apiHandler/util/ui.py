@@ -2,37 +2,368 @@
 
 ##  @package ui
 #   Provide simple user interaction
+#
+#   Prompts are shown by one of several backends, each running a
+#   dialog program directly. By default the backend with the lowest
+#   latency to show a dialog is chosen, if it was measured with
+#   \a calibrate(), else the first installed one, see \a fastest().
 
-import zenity
-import os
+import json, os, re, sys, time
 # own
-from apiHandler.util import log
+from apiHandler.util import log, paths
 
 ## Enable debug logging
 debug = False
 
+## Backend used by new \a Ui instances, a key of \a backends or 'auto'
+default_backend = 'auto'
+
+## Size of list dialogs in pixels
+list_width = 700
+list_height = 400
+
+## Number of dialogs a backend's latency is measured over
+bench_runs = 1
+
+## Seconds after which a measured dialog closes itself
+bench_delay = 1
+
+## Seconds after which a measured dialog is killed, if it does not close itself
+bench_limit = 10
+
+## Returned by \a Ui.choose() if the additional button was pressed
+MORE = -1
+
+
+## Convert dialog markup to plain text
+#  @param text string which may contain pango markup
+#  @return text without tags, links replaced by their target
+def _plain(text):
+	import html
+	text = re.sub(r"<a href=['\"]([^'\"]*)['\"]>(.*?)</a>", r"\2 (\1)", text)
+	return html.unescape(re.sub(r"<[^>]+>", "", text))
+
+## Escape text for pango markup
+#  @param text plain string
+#  @return text safe to show in markup
+def escape(text):
+	return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace("''", "&#39;")
+
+
+## @class Backend
+#  Show prompts with a dialog program
+#
+#  Backends implement the prompts of \a Ui, taking the same arguments.
+class Backend:
+
+	## Name of the dialog program
+	program = None
+
+	## Arguments making the program show a dialog which closes itself
+	#  after \a bench_delay seconds, None if it cannot do that
+	bench_args = None
+
+	## Whether prompts may contain links the user can open or copy
+	links = False
+
+	## Constructor
+	def __init__(self):
+		self._log = log.log(self.__class__.__name__, debug)
+
+	## Run the dialog program
+	#  @param args command line arguments
+	#  @param stdin text passed to the program (optional)
+	#  @return tuple of return code and output without trailing newline, or (None, None) if it could not be run
+	def _run(self, args, stdin=None):
+		import subprocess
+		try:
+			proc = subprocess.run([self.program] + args, input=stdin, capture_output=True, text=True)
+		except OSError as e:
+			self._log.err("could not run %s: %s" %(self.program, e))
+			return None, None
+		return proc.returncode, proc.stdout.rstrip('\n')
+
+
+## @class Zenity
+#  GTK dialogs using zenity
+class Zenity(Backend):
+
+	program = 'zenity'
+	bench_args = ['--info', '--text=chillfindr', '--timeout=%d' %(bench_delay)]
+	links = True
+
+	def get_input(self, prompt):
+		ret, out = self._run(['--entry', '--width=300', '--text=%s' %(prompt)])
+		return out if ret == 0 else None
+
+	def question(self, prompt):
+		ret, _ = self._run(['--question', '--width=300', '--text=%s' %(prompt)])
+		return ret == 0
+
+	def choose(self, prompt, columns, rows, more=""):
+		cmd = ['--list', '--width=%d' %(list_width), '--height=%d' %(list_height), '--text=%s' %(prompt),
+			'--column=#', '--hide-column=1', '--print-column=1']
+		cmd += ['--column=%s' %(col) for col in columns]
+		if more != "":
+			cmd.append('--extra-button=%s' %(more))
+		# cells starting with '-' must not be parsed as options
+		cmd.append('--')
+		for i, row in enumerate(rows):
+			cmd += [str(i)] + [str(cell) for cell in row]
+
+		ret, out = self._run(cmd)
+		if more != "" and out == more:
+			return MORE
+		if ret != 0 or not out.isdigit():
+			return None
+		return int(out)
+
+
+## @class Dmenu
+#  Menus using dmenu
+#
+#  dmenu shows a single line of text, so prompts are flattened
+#  and rows are shown as text lines.
+class Dmenu(Backend):
+
+	program = 'dmenu'
+
+	## Run the menu
+	#  @param prompt prompt text
+	#  @param lines menu entries
+	#  @return selected or typed entry, or None if aborted
+	def _menu(self, prompt, lines):
+		ret, out = self._run(['-l', str(min(len(lines), 20)), '-p', ' '.join(_plain(prompt).split())], '\n'.join(lines))
+		return out if ret == 0 else None
+
+	def get_input(self, prompt):
+		return self._menu(prompt, [])
+
+	def question(self, prompt):
+		return self._menu(prompt, ["Yes", "No"]) == "Yes"
+
+	def choose(self, prompt, columns, rows, more=""):
+		lines = ["%d: %s" %(i + 1, " | ".join(str(cell) for cell in row)) for i, row in enumerate(rows)]
+		if more != "":
+			lines.append(more)
+
+		out = self._menu(prompt, lines)
+		if out is None or out not in lines:
+			return None
+		if more != "" and out == more:
+			return MORE
+		return lines.index(out)
+
+
+## @class Rofi
+#  Menus using rofi
+#
+#  rofi's dmenu mode is used, which unlike dmenu can show markup
+#  and report the index of the selected entry.
+class Rofi(Dmenu):
+
+	program = 'rofi'
+	bench_args = ['-e', 'chillfindr', '-timeout-delay', str(bench_delay), '-timeout-action', 'kb-cancel']
+
+	def _menu(self, prompt, lines, index=False):
+		cmd = ['-dmenu', '-markup', '-mesg', prompt, '-p', '', '-l', str(len(lines))]
+		if len(lines) > 0:
+			cmd.append('-no-custom')
+		if index:
+			cmd += ['-format', 'i']
+		ret, out = self._run(cmd, '\n'.join(lines))
+		return out if ret == 0 else None
+
+	def choose(self, prompt, columns, rows, more=""):
+		lines = [" | ".join(escape(str(cell)) for cell in row) for row in rows]
+		if more != "":
+			lines.append(more)
+
+		out = self._menu(prompt, lines, index=True)
+		if out is None or not out.isdigit():
+			return None
+		if more != "" and int(out) == len(rows):
+			return MORE
+		return int(out)
+
+
+## @class Terminal
+#  Prompts on the controlling terminal
+#
+#  Never chosen automatically over a graphical backend, since
+#  chillfindr is usually run without a terminal to answer on.
+class Terminal(Backend):
+
+	links = True
+
+	def get_input(self, prompt):
+		try:
+			return input("%s " %(_plain(prompt)))
+		except EOFError:
+			return None
+
+	def question(self, prompt):
+		answer = self.get_input("%s [y/N]" %(prompt))
+		return answer is not None and answer.strip().lower() in ('y', 'yes')
+
+	def choose(self, prompt, columns, rows, more=""):
+		print(_plain(prompt))
+		for i, row in enumerate(rows):
+			print("%3d) %s" %(i + 1, " | ".join(str(cell) for cell in row)))
+
+		hint = "number%s, empty to abort:" %(", m for %s" %(more) if more != "" else "")
+		answer = self.get_input(hint)
+		if answer is None or answer.strip() == "":
+			return None
+		answer = answer.strip().lower()
+		if more != "" and answer in ('m', more.lower()):
+			return MORE
+		if answer.isdigit() and 1 <= int(answer) <= len(rows):
+			return int(answer) - 1
+		return None
+
+
+## Available backends, graphical ones in order of preference
+backends = {'zenity': Zenity, 'rofi': Rofi, 'dmenu': Dmenu, 'terminal': Terminal}
+
+
+## Measure a backend's latency to show a dialog
+#  @param name key of \a backends
+#  @return median milliseconds from starting the backend's program until
+#  its dialog is shown, or None if it is not installed or cannot be measured
+#
+#  A real dialog is shown, which closes itself after \a bench_delay seconds.
+#  The delay is subtracted, so what remains is the time the program took to
+#  start and show it. Dialogs which do not stay open that long could not
+#  be shown, e.g. without a display.
+def measure(name):
+	import shutil, subprocess
+	cls = backends[name]
+	if cls.program is None or cls.bench_args is None or shutil.which(cls.program) is None:
+		return None
+
+	times = []
+	for _ in range(bench_runs):
+		start = time.perf_counter()
+		try:
+			subprocess.run([cls.program] + cls.bench_args, stdin=subprocess.DEVNULL,
+				stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=bench_limit)
+		except subprocess.TimeoutExpired:
+			return None
+		ms = (time.perf_counter() - start) * 1000 - bench_delay * 1000
+		if ms < 0:
+			return None
+		times.append(ms)
+	return sorted(times)[len(times) // 2]
+
+
+## Describe the installed dialog programs
+#  @return dict of backend name to program path, modification time and
+#  measuring arguments, for each installed graphical backend
+def _stamp():
+	import shutil
+	stamp = {}
+	for name, cls in backends.items():
+		path = shutil.which(cls.program) if cls.program is not None else None
+		if path is not None:
+			stamp[name] = [path, os.stat(path).st_mtime, cls.bench_args]
+	return stamp
+
+## Get the path of the file measured latencies are stored in
+def _latency_file():
+	return os.path.join(paths.cache_dir(), 'ui.json')
+
+
+## Measure all installed backends and store the result for \a fastest()
+#  @return dict of backend name to milliseconds, None if it could not be measured
+#
+#  This shows a dialog of each measurable backend, so it is only run
+#  on request, e.g. by apiHandler.test.bench_ui.
+def calibrate():
+	stamp = _stamp()
+	data = {'stamp': stamp, 'latency': {name: measure(name) for name in stamp}}
+	file = _latency_file()
+	tmp = "%s.%d.tmp" %(file, os.getpid())
+	with open(tmp, 'w') as f:
+		json.dump(data, f)
+	os.replace(tmp, file)
+	return data['latency']
+
+
+## Choose the graphical backend with the lowest latency
+#  @param links only consider backends which can show links
+#  @return key of \a backends: the fastest measured one, else the first
+#  installed one in order of preference, 'terminal' if none is installed
+#  but a terminal is attached, else 'zenity'
+#
+#  Nothing is measured here, since that would show dialogs on the way to
+#  the first prompt. Measurements of \a calibrate() are only used while
+#  the measured programs are unchanged.
+def fastest(links=False):
+	stamp = _stamp()
+	try:
+		with open(_latency_file(), 'r') as f:
+			data = json.load(f)
+	except (OSError, ValueError):
+		data = {}
+	measured = data.get('latency', {}) if data.get('stamp') == stamp else {}
+
+	usable = [name for name in stamp if backends[name].links or not links]
+	latency = {name: measured[name] for name in usable if measured.get(name) is not None}
+	if len(latency) > 0:
+		return min(latency, key=latency.get)
+	if len(usable) > 0:
+		return usable[0]
+	return 'terminal' if sys.stdin.isatty() else 'zenity'
+
+
 ## @class Ui
 #  Helper class for graphical user interaction
 class Ui:
 
 	## Constructor
-	def __init__(self):
+	#  @param backend key of \a backends or 'auto' [default: \a default_backend]
+	#  @param links prompts contain links, which the user must be able to open or copy
+	#
+	#  If \a links is set and \a backend cannot show them, the fastest backend which can is used.
+	def __init__(self, backend=None, links=False):
 		self._log = log.log(self.__class__.__name__, debug)
 		self._log.dbg("hello from ui")
+		self._name = default_backend if backend is None else backend
+		self._links = links
+		self._backend = None
+
+	## Get the backend, choosing it on first use
+	def _get_backend(self):
+		if self._backend is None:
+			name = self._name
+			if name == 'auto' or (self._links and not backends[name].links):
+				name = fastest(self._links)
+			self._log.dbg("using %s dialogs" %(name))
+			self._backend = backends[name]()
+		return self._backend
 
 	## Get input from user
 	#  @param prompt Input prompt
 	#  @return user input or None if user aborted
 	def get_input(self, prompt):
 		self._log.dbg(prompt)
-		ret,entry = zenity.show(zenity.entry, 'width=300', text=prompt)
-		return entry if ret else None
+		return self._get_backend().get_input(prompt)
 
 	## Ask a yes/no question
 	#  @param prompt question string
 	#  @return True/False
 	def question(self, prompt):
 		self._log.dbg(prompt)
-		ans,_ = zenity.show(zenity.question, 'width=300', text=prompt)
-		return ans
+		return self._get_backend().question(prompt)
 
+	## Let user choose one row of a list
+	#  @param prompt text above the list
+	#  @param columns list of column titles
+	#  @param rows list of rows, each a list of one string per column
+	#  @param more label of an additional button, none if empty
+	#  @return index of the chosen row, \a MORE if the additional button
+	#  was pressed, or None if user aborted
+	def choose(self, prompt, columns, rows, more=""):
+		self._log.dbg(prompt)
+		return self._get_backend().choose(prompt, columns, rows, more)
@@ -5,8 +5,7 @@
 #
 #  Mainly parameter parsing and final presentation of the result
 
-import os, sys, getopt
-from apiHandler.test.test_reqs import TestRequirements
+import sys, getopt
 
 """
 MAIN
@@ -15,40 +14,99 @@ MAIN
 ws_name = ""
 helptext = """
 Usage:
- > chillfindr.py --now|--playlist [--query=<search term> -h]
+ > chillfindr.py --now|--playlist|--daemon [--query=<search term> --depth=<n> -h]
 
  # operations
  -n | --now           ... show currently playing track
  -p | --playlist      ... get playlist suggestions
+ --daemon             ... keep running and serve other calls of chillfindr
 
  # modifiers
- -q <s> | --query=<s> ... set playlist search term [optional]
+ -q <s> | --query=<s> ... set playlist search term, separate several keywords by commas [optional]
+ -d <n> | --depth=<n> ... search up to n playlists (max. 1000) [optional]
+ --refresh            ... ignore cached search results [optional]
+ --no-cache           ... neither read nor write the search cache [optional]
+ --no-daemon          ... do not forward this call to a running daemon [optional]
+ --validate           ... authorize all configured accounts on startup [optional]
+ --one-by-one         ... suggest one playlist per dialog instead of a list [optional]
+ --follow             ... with --now: keep running and print the song whenever it changes, implies --no-daemon [optional]
+ --json               ... with --follow: print json lines instead of plain text [optional]
+ --play               ... play the chosen playlist on a spotify device, open the browser only if none is available [optional]
+ --ui=<s>             ... dialogs to use: zenity, rofi, dmenu, terminal or auto (fastest installed), implies --no-daemon [optional]
 
  # misc
+ --cache-stats        ... show search cache statistics
+ --api-stats          ... show received bytes and decode time per API endpoint afterwards, implies --no-daemon
  -h                   ... show this help
 
  Note: Choose exactly one operation.
+       If a daemon is running, --now and --playlist are served by it.
 
 """
 
-if __name__ == '__main__':
+## Print currently playing track
+#  @param song 'artist - title' string
+def show_current(song):
+	print("currently listening to: %s" %(song))
 
-	tr = TestRequirements()
-	tr.test_requirements()
+## Print the currently playing track whenever it changes
+#  @param states iterable of dicts as yielded by \a ApiHandler.follow_current()
+#  @param as_json print json lines instead of the song, or an empty line if not playing
+def follow_current(states, as_json):
+	import json
+	try:
+		for state in states:
+			print(json.dumps(state) if as_json else (state['track'] if state['playing'] else ''), flush=True)
+	except (KeyboardInterrupt, BrokenPipeError):
+		pass
+
+## Open a playlist in the browser
+#  @param link playlist url or None
+def open_playlist(link):
+	if link is None:
+		print("no playlist selected")
+		return
+	import subprocess
+	print(link)
+	# started without a shell, so the link is never parsed as a command
+	try:
+		subprocess.run(['i3-msg', "workspace %s" %(ws_name)], stdout=subprocess.DEVNULL)
+		subprocess.Popen(['firefox', '--new-window', link], start_new_session=True)
+	except OSError as e:
+		print("could not open browser: %s" %(e))
 
-	from apiHandler import apiHandler
+## Report a playlist started on a device, else open it in the browser
+#  @param link playlist url or None
+#  @param device name of the device playing, or None
+def play_playlist(link, device):
+	if link is not None and device is not None:
+		print("playing %s on %s" %(link, device))
+		return
+	open_playlist(link)
 
-	print(sys.argv)
+
+if __name__ == '__main__':
 
 	try:
-		opts, args = getopt.getopt(sys.argv[1:], 'hnpq:', ['now', 'playlist', 'query=', 'help'])
+		opts, args = getopt.getopt(sys.argv[1:], 'hnpq:d:', ['now', 'playlist', 'query=', 'depth=', 'daemon', 'refresh', 'no-cache', 'no-daemon', 'validate', 'one-by-one', 'follow', 'json', 'play', 'ui=', 'cache-stats', 'api-stats', 'help'])
 	except getopt.GetoptError:
 		print(helptext)
 		exit(1)
 
 	current = False
 	playlist = False
+	daemonize = False
+	forward = True
 	term = None
+	depth = None
+	cached = True
+	refresh = False
+	api_stats = False
+	batch = True
+	play = False
+	follow = False
+	as_json = False
+	lazy = True
 
 	for opt,arg in opts:
 		if opt in ('-h', '--help'):
@@ -58,28 +116,104 @@ if __name__ == '__main__':
 			current = True
 		elif opt in ('-p', '--playlist'):
 			playlist = True
+		elif opt == '--daemon':
+			daemonize = True
 		elif opt in ('-q', '--query'):
-			term = arg
+			term = arg if term is None else "%s,%s" %(term, arg)
+		elif opt in ('-d', '--depth'):
+			if not arg.isdigit() or int(arg) < 1:
+				print("depth must be a positive number")
+				print(helptext)
+				exit(1)
+			depth = int(arg)
+		elif opt == '--refresh':
+			refresh = True
+		elif opt == '--no-cache':
+			cached = False
+		elif opt == '--no-daemon':
+			forward = False
+		elif opt == '--validate':
+			lazy = False
+		elif opt == '--ui':
+			from apiHandler.util import ui
+			if arg not in ui.backends and arg != 'auto':
+				print("unknown dialog type: %s" %(arg))
+				print(helptext)
+				exit(1)
+			ui.default_backend = arg
+			forward = False
+		elif opt == '--follow':
+			follow = True
+			forward = False
+		elif opt == '--json':
+			as_json = True
+		elif opt == '--play':
+			play = True
+		elif opt == '--one-by-one':
+			batch = False
+		elif opt == '--api-stats':
+			api_stats = True
+			forward = False
+		elif opt == '--cache-stats':
+			from apiHandler.util import cache
+			for name, value in cache.Cache('playlists').stats().items():
+				print("%s: %d" %(name, value))
+			exit(0)
 
-	if current == playlist:
+	# stdout only carries the songs while following, diagnostics go to stderr
+	if follow:
+		from apiHandler.util import log
+		log.stream = sys.stderr
+	else:
+		print(sys.argv)
+
+	if (current + playlist + daemonize) != 1:
 		print("select exactly one operation at a time")
 		print(helptext)
 		exit(1)
 
-	fetcher = apiHandler.ApiHandler(term)
+	if not daemonize and forward and cached and lazy:
+		from apiHandler import daemon
+		request = {'op': 'now'} if current else {'op': 'playlist', 'query': term, 'depth': depth, 'refresh': refresh, 'batch': batch, 'play': play}
+		response = daemon.Client().send(request)
+		if response is not None:
+			if not response.get('ok'):
+				print("daemon error: %s" %(response.get('error')))
+				exit(1)
+			if current:
+				show_current(response.get('result'))
+			else:
+				play_playlist(response.get('result'), response.get('device'))
+			exit(0)
+
+	from apiHandler.util import deps
+	if not deps.check():
+		exit(1)
+
+	if daemonize:
+		import signal
+		from apiHandler import daemon
+		signal.signal(signal.SIGTERM, lambda signum, frame: exit(0))
+		server = daemon.Server(cached=cached, lazy=lazy, batch=batch)
+		exit(0 if server.serve() else 1)
+
+	from apiHandler import apiHandler
+
+	fetcher = apiHandler.ApiHandler(term, depth, lazy=lazy, cached=cached, refresh=refresh, batch=batch)
 	if not fetcher.select_user():
 		print("no usable user config found, sorry.")
 		exit(1)
 	
-	if current:
-		print("currently listening to: %s" %(fetcher.get_current_playing()))
+	if current and follow:
+		follow_current(fetcher.follow_current(), as_json)
+	elif current:
+		show_current(fetcher.get_current_playing())
 	elif playlist:
 		link = fetcher.get_playlist()
-		if link is None:
-			print("no playlist selected")
-			exit(0)
-		print(link)
-		syscall = "i3-msg 'workspace %s; exec firefox --new-window %s;'" %(ws_name, link)
-		os.system(syscall)
+		play_playlist(link, fetcher.play(link) if play and link is not None else None)
+
+	if api_stats:
+		for name, stats in sorted(fetcher.stats().items()):
+			print("%s: %d requests, %d bytes, %.1f ms decoding" %(name, stats['requests'], stats['bytes'], stats['decode_ms']))
 
 	exit(0)